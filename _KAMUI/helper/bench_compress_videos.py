@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_compress_videos.py
+
+compress_videos.py のコーデック/プリセット選定用のエンコード速度ベンチマークです。
+- ffmpeg の lavfi（testsrc2 / noise）で合成テスト動画をローカル生成します（ダウンロード不要）。
+- CODEC_MAP の全コーデック × プリセット一覧を compress_videos.py と同じコマンドでエンコードし、
+  エンコード fps・実時間・CPU時間・ピークRSS・出力サイズを計測します。
+  -preset が効かないエンコーダ（libopenh264, libaom-av1）はプリセットを振らずに1回だけ計測し、
+  preset 欄を空・preset_applied=False として記録します（同じ結果がプリセット別に並ばないように）。
+- 結果は JSON と CSV に書き出すので、マシン間や過去の実行との比較に使えます。
+
+注意事項:
+- CPU時間/ピークRSS は Linux/macOS では os.wait4、Windows では psutil（任意）で取得します。
+  psutil が無い Windows 環境では空欄になります。
+"""
+
+import sys
+sys.stdout.reconfigure(encoding="utf-8")
+
+import argparse
+import csv
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import ffmpeg
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from compress_videos import CODEC_MAP, PRESETS, build_compress, human
+
+# 合成クリップの種類。noise は動きの多い素材（高難度）の代わり
+CLIPS = {
+    "testsrc": "testsrc2=size={size}:rate={rate}:duration={duration}",
+    "noise": "testsrc2=size={size}:rate={rate}:duration={duration},noise=alls=25:allf=t+u",
+}
+
+FIELDS = ["clip", "codec", "preset", "preset_applied", "crf", "ok", "frames", "wall_s", "fps",
+          "cpu_s", "peak_rss", "out_size", "error"]
+
+# -preset を受け付けるエンコーダ（libopenh264 には無く、libaom-av1 は -cpu-used で別物）
+PRESET_ENCODERS = {"libx264", "libx265"}
+
+
+def make_clip(kind: str, out_path: Path, size: str, rate: int, duration: float) -> None:
+    """lavfi から無劣化（FFV1）の合成クリップを生成。"""
+    src = CLIPS[kind].format(size=size, rate=rate, duration=duration)
+    (
+        ffmpeg
+        .input(src, f="lavfi")
+        .output(str(out_path), vcodec="ffv1", pix_fmt="yuv420p", y=None)
+        .global_args("-hide_banner", "-nostdin", "-loglevel", "error")
+        .run()
+    )
+
+
+def run_measured(cmd: list[str]) -> dict:
+    """コマンドを実行し、実時間・CPU時間・ピークRSS（取得できれば）を返す。"""
+    with tempfile.TemporaryFile() as err:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=err)
+        cpu_s = peak_rss = None
+        if hasattr(os, "wait4"):
+            _, status, ru = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            cpu_s = ru.ru_utime + ru.ru_stime
+            # ru_maxrss は Linux では KB、macOS では B
+            peak_rss = ru.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        elif psutil:
+            ps = psutil.Process(proc.pid)
+            peak_rss = 0
+            while proc.poll() is None:
+                try:
+                    peak_rss = max(peak_rss, ps.memory_info().rss)
+                    t = ps.cpu_times()
+                    cpu_s = t.user + t.system
+                except psutil.Error:
+                    pass
+                time.sleep(0.05)
+        else:
+            proc.wait()
+        wall_s = time.perf_counter() - t0
+        err.seek(0)
+        stderr = err.read().decode("utf-8", errors="replace").strip()
+    return {"returncode": proc.returncode, "wall_s": wall_s, "cpu_s": cpu_s,
+            "peak_rss": peak_rss, "stderr": stderr}
+
+
+def machine_info() -> dict:
+    try:
+        ver = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        ver = None
+    return {
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "ffmpeg": ver,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="compress_videos.py のコーデック/プリセット別エンコード速度ベンチマーク"
+    )
+    parser.add_argument("-o", "--output-dir", default=".", help="レポート出力先ディレクトリ（既定: カレント）")
+    parser.add_argument("--codecs", nargs="+", choices=list(CODEC_MAP), default=list(CODEC_MAP),
+                        help="計測するコーデック（既定: すべて）")
+    parser.add_argument("--presets", nargs="+", choices=PRESETS, default=PRESETS,
+                        help="計測するプリセット（既定: すべて。-preset の効くエンコーダ＝hevc のみに適用）")
+    parser.add_argument("--clips", nargs="+", choices=list(CLIPS), default=list(CLIPS),
+                        help="合成クリップの種類（既定: すべて）")
+    parser.add_argument("--crf", type=int, default=23, help="CRF（既定: 23）")
+    parser.add_argument("--size", default="1280x720", help="合成クリップの解像度（既定: 1280x720）")
+    parser.add_argument("--rate", type=int, default=30, help="合成クリップのフレームレート（既定: 30）")
+    parser.add_argument("--duration", type=float, default=5.0, help="合成クリップの長さ（秒, 既定: 5）")
+    parser.add_argument("--threads", type=int, default=0, help="エンコーダのスレッド数（既定: 0 = ffmpeg任せ）")
+    parser.add_argument("--tag", default="", help="レポートに付けるラベル（比較用）")
+
+    args = parser.parse_args()
+    out_dir = Path(args.output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    frames = int(args.rate * args.duration)
+
+    work = Path(tempfile.mkdtemp(prefix="ffbench_"))
+    rows = []
+    try:
+        clips = {}
+        for kind in args.clips:
+            clips[kind] = work / f"{kind}.mkv"
+            print(f"[INFO] 合成クリップ生成: {kind} ({args.size}, {args.rate}fps, {args.duration}s)")
+            make_clip(kind, clips[kind], args.size, args.rate, args.duration)
+
+        sweeps = {codec: args.presets if CODEC_MAP[codec] in PRESET_ENCODERS else [None]
+                  for codec in args.codecs}
+        total = len(clips) * sum(len(p) for p in sweeps.values())
+        n = 0
+        for kind, clip in clips.items():
+            for codec in args.codecs:
+                for preset in sweeps[codec]:
+                    n += 1
+                    out = work / f"out_{kind}_{codec}_{preset or 'default'}.mp4"
+                    cmd = build_compress(
+                        # preset が効かないエンコーダには compress_videos.py の既定値をそのまま渡す（無視される）
+                        clip, out, CODEC_MAP[codec], args.crf, preset or "medium", None,
+                        True, None, None, False, args.threads,
+                    ).compile()
+                    r = run_measured(cmd)
+                    ok = r["returncode"] == 0 and out.exists()
+                    row = {
+                        "clip": kind,
+                        "codec": codec,
+                        "preset": preset or "",
+                        "preset_applied": preset is not None,
+                        "crf": args.crf,
+                        "ok": ok,
+                        "frames": frames,
+                        "wall_s": round(r["wall_s"], 3),
+                        "fps": round(frames / r["wall_s"], 2) if ok and r["wall_s"] > 0 else None,
+                        "cpu_s": round(r["cpu_s"], 3) if r["cpu_s"] is not None else None,
+                        "peak_rss": r["peak_rss"],
+                        "out_size": out.stat().st_size if ok else None,
+                        "error": None if ok else r["stderr"][-500:],
+                    }
+                    rows.append(row)
+                    label = preset or "(preset無効)"
+                    if ok:
+                        rss = human(row["peak_rss"]) if row["peak_rss"] else "-"
+                        print(f"[{n}/{total}] {kind:<8} {codec:<5} {label:<10} "
+                              f"{row['fps']:>8.1f} fps  {row['wall_s']:>7.2f} s  cpu={row['cpu_s']}s  "
+                              f"rss={rss}  out={human(row['out_size'])}")
+                    else:
+                        print(f"[{n}/{total}] {kind:<8} {codec:<5} {label:<10} [ERR] {row['error']}")
+                    out.unlink(missing_ok=True)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    base = f"bench_compress_{stamp}{'_' + args.tag if args.tag else ''}"
+    # タグにドットが入っても（v1.2, box.local など）拡張子扱いされないよう、名前に直接付け足す
+    json_path = out_dir / (base + ".json")
+    csv_path = out_dir / (base + ".csv")
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "tag": args.tag,
+        "machine": machine_info(),
+        "params": {"size": args.size, "rate": args.rate, "duration": args.duration,
+                   "crf": args.crf, "threads": args.threads},
+        "results": rows,
+    }
+    json_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=FIELDS)
+        w.writeheader()
+        w.writerows(rows)
+
+    print(f"\n[完了] {len(rows)} 件計測。レポート: {json_path} / {csv_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bg_removal.py
+
+rembg による背景透過の共通ライブラリです。remove_bg.py / background_remover.py / rembg_server.py は
+このモジュールを呼ぶだけの薄いラッパーで、スクリプトからも同じ処理をプロセス内で呼び出せます。
+
+    import sys; sys.path.insert(0, "_KAMUI/helper")
+    from bg_removal import Options, remove_many
+
+    for r in remove_many(Path("images").glob("*.jpg"), Options(model="isnet-general-use"), workers=2):
+        print(r.message())          # r.ok / r.status / r.dst / r.size / r.error など
+
+- モデルセッションはモデル名ごとにプロセス内で使い回す（2回目以降の呼び出しでロード待ちが無い）
+- remove_many は入力をイテレータのまま少しずつ取り出し、同時に処理中の画像を max_inflight 枚に抑える
+  （大量の入力でもデコード済み画像や結果がメモリに溜まらない）。結果は完了順に Result で返す
+- 推論マスクのディスクキャッシュ（MaskCache）、縮小推論 + 境界補正（proxy_size）、
+  出力形式（png / webp / raw）、工程別時間（StageTimes）は remove_bg.py の各オプションと同じ
+"""
+
+import hashlib
+import io
+import math
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from rembg_server import submit
+
+# 対応拡張子
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff", ".bmp"}
+
+# セッションからモデル名が取れない場合にキャッシュキーに使う名前
+DEFAULT_MODEL = "u2net"
+DEFAULT_MASK_CACHE = Path.home() / ".cache" / "kamui_remove_bg" / "masks"
+
+# proxy_size 指定時の境界補正: タイル一辺（原寸px）、のりしろ、ガイデッドフィルタの半径と正則化
+REFINE_TILE = 512
+REFINE_MARGIN = 32
+REFINE_RADIUS = 8
+REFINE_EPS = 1e-3
+
+# 出力形式ごとの拡張子
+OUTPUT_EXTS = {"png": ".png", "webp": ".webp", "raw": ".npy"}
+
+# StageTimes で計測する工程（表示順）
+STAGES = ("read", "decode", "infer", "compose", "encode", "write")
+
+
+def _cutout_funcs():
+    """rembg の合成関数を返す。rembg（onnxruntime）の読み込みは秒単位で重いので、
+    --server 利用時など推論・合成をしない呼び出しでは import しない"""
+    from rembg.bg import alpha_matting_cutout, naive_cutout
+    try:
+        from rembg.bg import apply_background_color
+    except ImportError:
+        # rembg の古い版では apply_background という名前
+        from rembg.bg import apply_background as apply_background_color
+    return alpha_matting_cutout, naive_cutout, apply_background_color
+
+
+def is_image(p: Path) -> bool:
+    return p.is_file() and p.suffix.lower() in IMAGE_EXTS
+
+
+def iter_images(root: Path):
+    if root.is_file():
+        if is_image(root):
+            yield root
+    else:
+        for p in sorted(root.rglob("*")):
+            if is_image(p):
+                yield p
+
+
+def plan_output_path(inp: Path, out_dir: Path | None, ext: str = ".png") -> Path:
+    if out_dir:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        return out_dir / (inp.stem + "_nobg" + ext)
+    return inp.with_stem(inp.stem + "_nobg").with_suffix(ext)
+
+
+def parse_color(s: str) -> tuple[int, int, int, int]:
+    """"#rgb" / "#rrggbb" / "#rrggbbaa" を RGBA タプルに。不正なら ValueError。"""
+    h = s.strip().lstrip("#")
+    if len(h) in (3, 4):
+        h = "".join(c * 2 for c in h)
+    if len(h) == 6:
+        h += "ff"
+    if len(h) != 8:
+        raise ValueError(f"色の形式が不正です: {s}")
+    return tuple(int(h[i:i + 2], 16) for i in range(0, 8, 2))
+
+
+class MaskCache:
+    """(画像内容ハッシュ, モデル) -> 推論マスク をグレースケールPNGで保存するディスクキャッシュ。
+
+    参照時に mtime を更新し、合計サイズが上限を超えたら古いものから消す（LRU）。
+    ワーカースレッドから同時に呼ばれるので、書込は一時ファイル + リネームで行う。
+    """
+
+    def __init__(self, root: Path, cap_bytes: int):
+        root.mkdir(parents=True, exist_ok=True)
+        self.root = root
+        self.cap = cap_bytes
+        self.lock = threading.Lock()
+        self.total = sum(p.stat().st_size for p in root.glob("*.png"))
+
+    @staticmethod
+    def key(data: bytes, model: str) -> str:
+        return f"{hashlib.blake2b(data, digest_size=20).hexdigest()}_{model}"
+
+    def get(self, key: str) -> Image.Image | None:
+        p = self.root / f"{key}.png"
+        try:
+            with Image.open(p) as im:
+                mask = im.convert("L")
+            os.utime(p)
+            return mask
+        except FileNotFoundError:
+            return None
+        except OSError:
+            # 壊れたキャッシュは捨てて再推論
+            p.unlink(missing_ok=True)
+            return None
+
+    def put(self, key: str, mask: Image.Image) -> None:
+        p = self.root / f"{key}.png"
+        tmp = self.root / f"{key}.{threading.get_ident()}.part"
+        mask.save(tmp, "PNG", compress_level=6)
+        os.replace(tmp, p)
+        with self.lock:
+            self.total += p.stat().st_size
+            if self.total > self.cap:
+                self._evict()
+
+    def _evict(self) -> None:
+        # 上限の9割まで古い順に削除（毎回ギリギリで消し続けないように）
+        files = []
+        for p in self.root.glob("*.png"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, p in files:
+            if total <= self.cap * 0.9:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+        self.total = total
+
+
+def _box(a: np.ndarray, r: int) -> np.ndarray:
+    """半径 r の平均フィルタ（縦横に分けた累積和で計算, 端は有効画素数で割る）。"""
+    def sums(x: np.ndarray, axis: int) -> np.ndarray:
+        pad = [(0, 0)] * x.ndim
+        pad[axis] = (r + 1, r)
+        c = np.pad(x, pad).cumsum(axis)
+        n = x.shape[axis]
+        return c.take(range(2 * r + 1, n + 2 * r + 1), axis) - c.take(range(n), axis)
+
+    count = sums(np.ones((a.shape[0], 1), a.dtype), 0) * sums(np.ones((1, a.shape[1]), a.dtype), 1)
+    return sums(sums(a, 0), 1) / count
+
+
+def guided_refine(img: Image.Image, mask: Image.Image) -> Image.Image:
+    """元画像の輝度をガイドにしたガイデッドフィルタで、拡大マスクの輪郭を画像のエッジに合わせる。"""
+    guide = np.asarray(img.convert("L"), dtype=np.float32) / 255
+    p = np.asarray(mask, dtype=np.float32) / 255
+    r = REFINE_RADIUS
+    mean_i = _box(guide, r)
+    mean_p = _box(p, r)
+    var_i = _box(guide * guide, r) - mean_i * mean_i
+    cov_ip = _box(guide * p, r) - mean_i * mean_p
+    a = cov_ip / (var_i + REFINE_EPS)
+    b = mean_p - a * mean_i
+    q = _box(a, r) * guide + _box(b, r)
+    return Image.fromarray((np.clip(q, 0, 1) * 255 + 0.5).astype(np.uint8), mode="L")
+
+
+def to_proxy(img: Image.Image, max_side: int) -> Image.Image:
+    """長辺 max_side 以下の推論用縮小画像。"""
+    scale = max_side / max(img.size)
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.Resampling.BILINEAR, reducing_gap=3.0)
+
+
+def refine_upscaled_mask(img: Image.Image, small: Image.Image, opts) -> Image.Image:
+    """縮小画像で推論したマスクを原寸へ拡大し、境界帯にかかるタイルだけ原寸で補正する。"""
+    w, h = img.size
+    full = small.resize((w, h), Image.Resampling.BILINEAR)
+    sx, sy = small.width / w, small.height / h
+
+    for ty in range(0, h, REFINE_TILE):
+        for tx in range(0, w, REFINE_TILE):
+            box = (tx, ty, min(w, tx + REFINE_TILE), min(h, ty + REFINE_TILE))
+            sbox = (math.floor(box[0] * sx), math.floor(box[1] * sy),
+                    math.ceil(box[2] * sx), math.ceil(box[3] * sy))
+            # 縮小マスク上でタイル内に前景と背景が混在する（境界帯にかかる）タイルだけ補正する
+            lo, hi = small.crop(sbox).getextrema()
+            if hi - lo <= 16:
+                continue
+            # のりしろ付きで処理し、中央部分だけを書き戻して継ぎ目を防ぐ
+            mbox = (max(0, box[0] - REFINE_MARGIN), max(0, box[1] - REFINE_MARGIN),
+                    min(w, box[2] + REFINE_MARGIN), min(h, box[3] + REFINE_MARGIN))
+            tile_img = img.crop(mbox)
+            tile_mask = full.crop(mbox)
+            alpha = None
+            if opts.alpha_matting:
+                alpha_matting_cutout, _, _ = _cutout_funcs()
+                try:
+                    alpha = alpha_matting_cutout(
+                        tile_img, tile_mask,
+                        opts.am_foreground_thresh, opts.am_background_thresh, opts.am_erode,
+                    ).getchannel("A")
+                except ValueError:
+                    pass
+            if alpha is None:
+                alpha = guided_refine(tile_img, tile_mask)
+            inner = (box[0] - mbox[0], box[1] - mbox[1], box[2] - mbox[0], box[3] - mbox[1])
+            full.paste(alpha.crop(inner), box[:2])
+    return full
+
+
+def compose(img: Image.Image, mask: Image.Image, opts, matting: bool = True) -> Image.Image:
+    """マスクから出力画像を作る（rembg.remove の後段と同じ処理）。推論は含まない。
+    matting=False ならアルファマッティングを行わない（補正済みマスクを使う場合）。"""
+    if opts.only_mask:
+        return mask
+    alpha_matting_cutout, naive_cutout, apply_background_color = _cutout_funcs()
+    if opts.alpha_matting and matting:
+        try:
+            cutout = alpha_matting_cutout(
+                img, mask,
+                opts.am_foreground_thresh, opts.am_background_thresh, opts.am_erode,
+            )
+        except ValueError:
+            # 前景/背景の判定が片寄ってマッティングできない場合は単純切り抜き
+            cutout = naive_cutout(img, mask)
+    else:
+        cutout = naive_cutout(img, mask)
+    if opts.bg:
+        cutout = apply_background_color(cutout, parse_color(opts.bg))
+    return cutout
+
+
+class StageTimes:
+    """工程別の所要時間。1枚ごとに measure() で計測し、add() で全体の合計に足し込む。"""
+
+    def __init__(self):
+        self.total = dict.fromkeys(STAGES, 0.0)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    @contextmanager
+    def measure(rec: dict, stage: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            rec[stage] = rec.get(stage, 0.0) + time.perf_counter() - t0
+
+    def add(self, rec: dict) -> None:
+        with self.lock:
+            for k, v in rec.items():
+                self.total[k] += v
+
+    @staticmethod
+    def format(rec: dict) -> str:
+        return " ".join(f"{k}={rec[k] * 1000:.0f}ms" for k in STAGES if k in rec)
+
+    def summary(self) -> str:
+        """合計（ワーカー全体の延べ時間）と割合。"""
+        whole = sum(self.total.values()) or 1.0
+        return "  ".join(f"{k} {v:.2f}s ({v / whole:.0%})" for k, v in self.total.items())
+
+
+def encode_output(img: Image.Image, fmt: str, png_level: int) -> bytes:
+    """出力画像を --format の形式でバイト列にする。"""
+    buf = io.BytesIO()
+    if fmt == "webp":
+        # method=0 が最速。ロスレスなので画質は変わらない
+        img.save(buf, "WEBP", lossless=True, method=0)
+    elif fmt == "raw":
+        np.save(buf, np.asarray(img if img.mode == "L" else img.convert("RGBA")))
+    else:
+        img.save(buf, "PNG", compress_level=png_level)
+    return buf.getvalue()
+
+
+def write_atomic(dst: Path, data: bytes) -> None:
+    """出力先と同じディレクトリの一時ファイルに書いてから os.replace で置き換える。"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.{threading.get_ident()}.part")
+    try:
+        with open(tmp, "wb") as o:
+            o.write(data)
+        os.replace(tmp, dst)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+
+@dataclass
+class Options:
+    """処理オプション。フィールド名は remove_bg.py の argparse の dest と同じなので、
+    以下の関数には argparse.Namespace をそのまま渡してもよい。"""
+    model: str | None = None
+    alpha_matting: bool = False
+    am_foreground_thresh: int = 240
+    am_background_thresh: int = 10
+    am_erode: int = 10
+    only_mask: bool = False
+    bg: str | None = None
+    proxy_size: int = 0
+    format: str = "png"
+    png_level: int = 1
+    force: bool = False
+
+
+@dataclass
+class Result:
+    """1枚分の処理結果。status は "ok" / "skip" / "error"。"""
+    src: Path
+    dst: Path
+    status: str
+    error: str | None = None
+    mask_cached: bool = False
+    size: tuple[int, int] | None = None
+    out_bytes: int = 0
+    timings: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+    def message(self) -> str:
+        """CLI 用の1行表示（[OK] / [SKIP] / [ERR]）。"""
+        if self.status == "skip":
+            return f"[SKIP] 既に存在: {self.dst}"
+        if self.status == "error":
+            return f"[ERR] {self.src.name}: {self.error}"
+        note = " (mask cache)" if self.mask_cached else ""
+        if self.timings:
+            note += f"  [{StageTimes.format(self.timings)}]"
+        return f"[OK] {self.src.name} -> {self.dst.name}{note}"
+
+
+def render(data: bytes, session, opts, masks: MaskCache | None = None,
+           rec: dict | None = None) -> tuple[bytes, tuple[int, int], bool]:
+    """画像バイト列を処理し (出力バイト列, 出力サイズ, マスクキャッシュ命中) を返す。書込は行わない。
+    rec を渡すと decode/infer/compose/encode の所要時間を記録する。"""
+    rec = {} if rec is None else rec
+    stage = StageTimes.measure
+    with stage(rec, "decode"):
+        img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+        img.load()
+    model = opts.model or getattr(session, "model_name", DEFAULT_MODEL)
+    proxy = opts.proxy_size and max(img.size) > opts.proxy_size
+    if proxy:
+        # 縮小推論のマスクは原寸推論のものと別物なのでキーを分ける
+        model += f"@{opts.proxy_size}"
+    key = MaskCache.key(data, model) if masks else None
+    with stage(rec, "infer"):
+        mask = masks.get(key) if masks else None
+        cached = mask is not None
+        if not cached:
+            mask = session.predict(to_proxy(img, opts.proxy_size) if proxy else img)[0]
+            if masks:
+                masks.put(key, mask)
+    with stage(rec, "compose"):
+        if proxy:
+            mask = refine_upscaled_mask(img, mask, opts)
+        out = compose(img, mask, opts, matting=not proxy)
+    with stage(rec, "encode"):
+        out_bytes = encode_output(out, opts.format, opts.png_level)
+    return out_bytes, out.size, cached
+
+
+def process_one(src: Path, dst: Path, session, opts, server: str | None = None,
+                masks: MaskCache | None = None, times: StageTimes | None = None) -> Result:
+    """1枚処理して dst に書き出す。server を指定すると常駐サーバに依頼する（session は使わない）。
+    masks を渡すと推論マスクをキャッシュから再利用する。times を渡すと工程別時間を集計する。
+    失敗時は例外送出（remove_many では Result(status="error") になる）。"""
+    if dst.exists() and not opts.force:
+        return Result(src, dst, "skip")
+
+    rec = {}
+    stage = StageTimes.measure
+    with stage(rec, "read"):
+        with open(src, "rb") as f:
+            data = f.read()
+
+    cached = False
+    if server:
+        with stage(rec, "infer"):
+            out_bytes = submit(
+                server, data, opts.model,
+                alpha_matting=opts.alpha_matting,
+                alpha_matting_foreground_threshold=opts.am_foreground_thresh,
+                alpha_matting_background_threshold=opts.am_background_thresh,
+                alpha_matting_erode_size=opts.am_erode,
+                only_mask=opts.only_mask,
+                bg=opts.bg,
+            )
+        with stage(rec, "decode"):
+            out = Image.open(io.BytesIO(out_bytes))
+            size = out.size
+        if opts.format != "png":
+            # サーバは PNG で返すので、他形式はここで変換する
+            with stage(rec, "encode"):
+                out_bytes = encode_output(out, opts.format, opts.png_level)
+    else:
+        out_bytes, size, cached = render(data, session, opts, masks, rec)
+
+    with stage(rec, "write"):
+        write_atomic(dst, out_bytes)
+
+    if times:
+        times.add(rec)
+    return Result(src, dst, "ok", mask_cached=cached, size=size, out_bytes=len(out_bytes),
+                  timings=rec if times else {})
+
+
+# モデル名 -> セッションのプール。プロセス内で使い回す
+_SESSIONS: dict[str, "queue.Queue"] = {}
+_SESSION_COUNTS: dict[str, int] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def session_pool(model: str | None, n: int = 1) -> "queue.Queue":
+    """モデルのセッションを最低 n 個持つプールを返す（未ロード分だけロード）。失敗時は例外送出。
+    プール内のセッションは1タスクごとに get() で借りて put() で返す。"""
+    from rembg import new_session
+
+    name = model or ""
+    with _SESSIONS_LOCK:
+        pool = _SESSIONS.setdefault(name, queue.Queue())
+        while _SESSION_COUNTS.get(name, 0) < n:
+            pool.put(new_session(model) if model else new_session())
+            _SESSION_COUNTS[name] = _SESSION_COUNTS.get(name, 0) + 1
+        return pool
+
+
+def remove_many(items: Iterable, opts=None, *, workers: int = 1, out_dir: Path | None = None,
+                server: str | None = None, masks: MaskCache | None = None,
+                times: StageTimes | None = None, max_inflight: int | None = None) -> Iterator[Result]:
+    """画像をまとめて背景透過し、完了順に Result を返すジェネレータ。
+
+    items はパスか (入力, 出力) のタプルのイテラブル。パスだけなら出力は plan_output_path で決める。
+    同時に処理中の画像は max_inflight（既定: workers * 2）枚まで。入力は必要な分だけ取り出す。
+    server を指定するとモデルをロードせず常駐サーバに依頼する。
+    """
+    opts = opts or Options()
+    workers = max(1, workers)
+    limit = max(workers, max_inflight or workers * 2)
+    ext = OUTPUT_EXTS[opts.format]
+    sessions = None if server else session_pool(opts.model, workers)
+
+    def work(src: Path, dst: Path) -> Result:
+        session = sessions.get() if sessions else None
+        try:
+            return process_one(src, dst, session, opts, server, masks, times)
+        except Exception as e:
+            return Result(src, dst, "error", error=str(e))
+        finally:
+            if sessions:
+                sessions.put(session)
+
+    it = iter(items)
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        while True:
+            for item in it:
+                src, dst = item if isinstance(item, tuple) else (item, None)
+                src = Path(src)
+                dst = Path(dst) if dst else plan_output_path(src, out_dir, ext)
+                pending.add(ex.submit(work, src, dst))
+                if len(pending) >= limit:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
+
+
+def remove_one(src, dst=None, opts=None, **kwargs) -> Result:
+    """1枚だけ処理する remove_many の簡易版。"""
+    return next(remove_many([(src, dst)], opts, **kwargs))
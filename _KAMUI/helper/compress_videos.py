@@ -9,6 +9,21 @@ compress_videos.py
 - 既定設定は H.264 + CRF=23 + preset=medium + 音声copy。
 - CRF値やコーデック（h264/hevc/av1）、音声処理、faststart などをオプションで制御可能です。
 - 元ファイルよりサイズが大きくなる場合はスキップし、--force-replace を付けると上書きします。
+- --jobs N で複数の ffmpeg を並列実行します（CPUコアをジョブ間で分割し -threads を指定、大きいファイルから順に投入）。
+- 結果キャッシュ（SQLite）に「入力内容ハッシュ + エンコード設定」ごとの結果（成功/サイズ悪化で保留）を記録し、
+  再実行時は未変更のファイルを再エンコードせずにスキップします（--no-cache で無効化）。
+- エンコード前に全ファイルを ffprobe（並列）し、既に目標ビットレート以下で縮まない見込みのもの
+  （入力コーデックの効率も考慮。MJPEG や MPEG-4 Part 2 などは同じビットレートでも縮む見込みとする）は
+  スキップ（--faststart 指定時は -c copy で faststart 付きリマックス）します。計画表を先に表示します（--no-plan で無効化）。
+- --target-size（例: 40%, 500M）/ --target-quality（VMAF）を指定すると、数か所の短いサンプルを複数CRFで試し打ちして
+  サイズ/品質曲線を当てはめ、ファイルごとにCRFを自動決定します（決定値はキャッシュに保存）。
+  CRF の効くエンコーダ（--codec hevc / av1）でのみ使えます。h264 の libopenh264 は CRF 非対応のためエラーにします。
+- --chunks N を指定すると、--chunk-min-sec 以上の長尺動画をキーフレームで N 分割して並列エンコードし、
+  無劣化で連結します（音声は元ファイルから1回だけ処理）。所要時間は split/encode/concat ごとに表示します。
+- --progress でエンコード中の進捗（fps・速度倍率・進捗率・ETA, ファイル別/全体）を逐次表示し、
+  --progress-json で同じ内容を JSON Lines として書き出します（ffmpeg の -progress pipe: を解析）。
+- 各ファイルの結果（成功/保留/失敗）はジャーナル（追記専用の JSON Lines）に記録し、途中で落ちたバッチは
+  --resume で続きから再開できます。作業ファイルは出力先と同じディレクトリに置き、最後はリネームで確定します。
 
 注意事項:
 - このスクリプトは Windows 環境（Git Bash, PowerShell 等）での利用を想定しています。
@@ -24,29 +39,94 @@ import sys
 sys.stdout.reconfigure(encoding="utf-8")
 
 import argparse
+import hashlib
+import json
+import math
 import os
+import re
 from pathlib import Path
 import ffmpeg
+import sqlite3
 import tempfile
 import shutil
+import statistics
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 
 
 VIDEO_EXTS = {".mp4", ".mov", ".mkv", ".m4v", ".avi", ".webm"}
 
+PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+
 CODEC_MAP = {
     "h264": "libopenh264",
     "hevc": "libx265", 
     "av1":  "libaom-av1",  # CPUエンコード（遅いが高圧縮）
 }
 
+# -crf を受け付けるエンコーダ（libopenh264 はビットレート制御のみで CRF が効かない）。
+# CRF自動調整（--target-size / --target-quality）はこれらのエンコーダでのみ使える
+CRF_ENCODERS = {"libx264", "libx265", "libaom-av1"}
+
+# CRF=23 のときに得られる bits/pixel/frame の目安。CRF が 6 上がるごとにおよそ半分になる。
+BASE_BPP = {
+    "h264": 0.08,
+    "hevc": 0.05,
+    "av1":  0.04,
+}
+# 入力側コーデックの圧縮効率: 同じ画質に必要なビット数の H.264 比（表に無いものは 1.0 とみなす）。
+# 旧世代/イントラのみのコーデックは同じ bpp でも画質が低い＝再エンコードで大きく縮む余地がある
+SOURCE_CODEC_FACTOR = {
+    "h264": 1.0,
+    "hevc": 0.6,
+    "av1": 0.5,
+    "vp9": 0.6,
+    "vp8": 1.1,
+    "mpeg4": 1.6,
+    "msmpeg4v3": 1.8,
+    "wmv3": 1.5,
+    "mpeg2video": 2.0,
+    "mpeg1video": 2.5,
+    "mjpeg": 6.0,
+    "prores": 8.0,
+    "dnxhd": 8.0,
+}
+# 元のbppが目安のこの倍率以下なら再エンコードしても縮まないとみなす
+PLAN_MARGIN = 1.1
+PROBE_WORKERS = 8
+
+# CRF自動調整: 動画内の SAMPLE_COUNT か所から SAMPLE_SEC 秒ずつ切り出し、候補CRFで試し打ちする
+SAMPLE_COUNT = 3
+SAMPLE_SEC = 4.0
+CRF_CANDIDATES = {
+    "h264": [18, 23, 28, 33],
+    "hevc": [18, 23, 28, 33],
+    "av1":  [24, 32, 40, 48],
+}
+CRF_RANGE = {
+    "h264": (0, 51),
+    "hevc": (0, 51),
+    "av1":  (0, 63),
+}
+
+# 進捗表示の最小間隔（秒, ファイルごと）
+PROGRESS_INTERVAL = 2.0
+
+CACHE_NAME = ".compress_cache.sqlite"
+JOURNAL_NAME = ".compress_journal.jsonl"
+# 作業ディレクトリの接頭辞（出力先に作るので、入力走査からは除外する）
+SCRATCH_PREFIX = ".ffx_"
+HASH_CHUNK = 1024 * 1024
+
 def human(n):
     for u in ["B","KB","MB","GB","TB"]:
         if n < 1024 or u == "TB":
             return f"{n:.1f}{u}"
         n /= 1024
 
-def compress_one(
+def build_compress(
     in_path: Path,
     out_path: Path,
     vcodec: str,
@@ -57,9 +137,18 @@ def compress_one(
     audio_bitrate: str|None,
     pix_fmt: str|None,
     faststart: bool,
-) -> None:
-    """1ファイルを圧縮。失敗時は例外送出。"""
-    stream_in = ffmpeg.input(str(in_path))
+    threads: int = 0,
+    start: float|None = None,
+    length: float|None = None,
+):
+    """圧縮用の ffmpeg コマンド（ffmpeg-python のノード）を組み立てる。
+    threads>0 ならエンコーダのスレッド数を固定。start/length を指定すると、その区間だけを切り出す（CRF試し打ち用）。"""
+    in_kwargs = {}
+    if start is not None:
+        in_kwargs["ss"] = start
+    if length is not None:
+        in_kwargs["t"] = length
+    stream_in = ffmpeg.input(str(in_path), **in_kwargs)
 
     out_kwargs = {
         "vcodec": vcodec,
@@ -73,6 +162,8 @@ def compress_one(
         out_kwargs["tune"] = tune
     if pix_fmt:
         out_kwargs["pix_fmt"] = pix_fmt
+    if threads > 0:
+        out_kwargs["threads"] = threads
     # mp4のシーク改善
     if faststart:
         out_kwargs["movflags"] = (out_kwargs.get("movflags","") + "+faststart").lstrip("+")
@@ -87,13 +178,305 @@ def compress_one(
     # 容赦なく上書き
     out_kwargs["y"] = None
 
-    (
+    return (
         ffmpeg
         .output(stream_in, str(out_path), **out_kwargs)
-        .global_args("-hide_banner", "-loglevel", "error")
+        # 並列実行時に複数の ffmpeg が端末の標準入力を奪い合わないよう -nostdin
+        .global_args("-hide_banner", "-nostdin", "-loglevel", "error")
+    )
+
+def run_with_progress(node, on_progress) -> None:
+    """-progress pipe:1 を付けて非同期実行し、1ブロックごとに on_progress(dict) を呼ぶ。
+    失敗時は node.run() と同じく stderr 付きの ffmpeg.Error を送出。"""
+    proc = node.global_args("-progress", "pipe:1", "-nostats").run_async(pipe_stdout=True, pipe_stderr=True)
+    # stderr は別スレッドで読み切る（パイプが詰まって ffmpeg が止まらないように）
+    err_chunks = []
+    drain = threading.Thread(target=lambda: err_chunks.append(proc.stderr.read()), daemon=True)
+    drain.start()
+    block = {}
+    for raw in proc.stdout:
+        key, _, val = raw.decode("utf-8", errors="replace").strip().partition("=")
+        block[key] = val
+        # 各ブロックは progress=continue|end で終わる
+        if key == "progress":
+            on_progress(block)
+            block = {}
+    proc.wait()
+    drain.join()
+    if proc.returncode != 0:
+        raise ffmpeg.Error("ffmpeg", None, b"".join(err_chunks))
+
+def compress_one(*args, progress=None, **kwargs) -> None:
+    """1ファイルを圧縮。失敗時は例外送出。引数は build_compress と同じ。
+    progress（コールバック）を渡すと ffmpeg の進捗を逐次通知する。"""
+    node = build_compress(*args, **kwargs)
+    if progress:
+        run_with_progress(node, progress)
+    else:
+        node.run()
+
+def remux_one(in_path: Path, out_path: Path) -> None:
+    """再エンコードせずに mp4 へ詰め直す（-c copy + faststart）。失敗時は例外送出。"""
+    (
+        ffmpeg
+        .output(ffmpeg.input(str(in_path)), str(out_path),
+                c="copy", map_metadata="0", movflags="use_metadata_tags+faststart", y=None)
+        .global_args("-hide_banner", "-nostdin", "-loglevel", "error")
+        .run()
+    )
+
+@dataclass
+class ProbeInfo:
+    vcodec: str|None
+    width: int
+    height: int
+    fps: float
+    duration: float
+    v_bitrate: int|None  # bps
+
+    @property
+    def bpp(self) -> float|None:
+        """1画素1フレームあたりのビット数。"""
+        if not self.v_bitrate or not (self.width and self.height and self.fps):
+            return None
+        return self.v_bitrate / (self.width * self.height * self.fps)
+
+def _rate(s: str|None) -> float:
+    """ffprobe の "30000/1001" 形式を float に。"""
+    try:
+        num, _, den = (s or "0").partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+def probe_video(p: Path) -> ProbeInfo:
+    """ffprobe で映像ストリームの情報を取得。失敗時は例外送出。"""
+    meta = ffmpeg.probe(str(p))
+    fmt = meta.get("format", {})
+    streams = meta.get("streams", [])
+    v = next((st for st in streams if st.get("codec_type") == "video"), {})
+    duration = float(fmt.get("duration") or v.get("duration") or 0)
+
+    v_bitrate = int(v["bit_rate"]) if v.get("bit_rate") else None
+    if v_bitrate is None and duration > 0:
+        # mkv/webm などストリーム単位のビットレートが無い場合は全体から音声分を引いて推定
+        total = int(fmt.get("bit_rate") or 0) or int(p.stat().st_size * 8 / duration)
+        audio = sum(int(st.get("bit_rate") or 0) for st in streams if st.get("codec_type") == "audio")
+        v_bitrate = max(0, total - audio) or None
+
+    return ProbeInfo(
+        vcodec=v.get("codec_name"),
+        width=int(v.get("width") or 0),
+        height=int(v.get("height") or 0),
+        fps=_rate(v.get("avg_frame_rate")) or _rate(v.get("r_frame_rate")),
+        duration=duration,
+        v_bitrate=v_bitrate,
+    )
+
+def probe_all(paths: list[Path]) -> dict[Path, ProbeInfo|None]:
+    """全ファイルを並列に ffprobe。失敗したものは None。"""
+    def safe_probe(p: Path):
+        try:
+            return probe_video(p)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, max(1, len(paths)))) as ex:
+        return dict(zip(paths, ex.map(safe_probe, paths)))
+
+def target_bpp(codec: str, crf: int) -> float:
+    return BASE_BPP[codec] * 2 ** ((23 - crf) / 6)
+
+def plan_action(info: ProbeInfo|None, args) -> tuple[str, str]:
+    """("encode"|"remux"|"skip", 理由) を返す。判断できない場合は encode に倒す。
+    目安は出力コーデックと CRF から求めた bpp を、入力と出力のコーデック効率の比（SOURCE_CODEC_FACTOR）で
+    入力側の bpp に換算したもの（効率の悪い入力ほど同じ bpp でも画質が低く、目安は小さくなる）。"""
+    if args.force_replace:
+        return "encode", "--force-replace"
+    if args.target_size or args.target_quality is not None:
+        return "encode", "CRF自動調整（サンプルで判定）"
+    if CODEC_MAP[args.codec] not in CRF_ENCODERS:
+        # CRF が効かないエンコーダでは CRF からの出力サイズ予測が成り立たない
+        return "encode", f"{CODEC_MAP[args.codec]} は CRF 非対応のため予測なし"
+    if info is None:
+        return "encode", "probe失敗"
+    bpp = info.bpp
+    if bpp is None:
+        return "encode", "ビットレート不明"
+    est = (target_bpp(args.codec, args.crf) * SOURCE_CODEC_FACTOR[args.codec]
+           / SOURCE_CODEC_FACTOR.get(info.vcodec or "", 1.0))
+    if bpp <= est * PLAN_MARGIN:
+        reason = f"既に低ビットレート ({bpp:.3f} <= {est:.3f} bpp)"
+        return ("remux" if args.faststart else "skip"), reason
+    return "encode", f"{bpp:.3f} bpp -> 目安 {est:.3f} bpp"
+
+def print_plan(plans: dict[Path, tuple[str, str]], infos: dict[Path, ProbeInfo|None]) -> None:
+    print(f"[PLAN] {'action':<7} {'codec':<6} {'size':>10} {'fps':>6} {'kbps':>8}  file (理由)")
+    for src, (action, reason) in plans.items():
+        info = infos.get(src)
+        if info:
+            res = f"{info.width}x{info.height}"
+            kbps = f"{info.v_bitrate / 1000:.0f}" if info.v_bitrate else "-"
+            print(f"[PLAN] {action:<7} {info.vcodec or '-':<6} {res:>10} {info.fps:>6.2f} {kbps:>8}  {src.name} ({reason})")
+        else:
+            print(f"[PLAN] {action:<7} {'-':<6} {'-':>10} {'-':>6} {'-':>8}  {src.name} ({reason})")
+    counts = {a: sum(1 for act, _ in plans.values() if act == a) for a in ("encode", "remux", "skip")}
+    print(f"[PLAN] encode={counts['encode']} remux={counts['remux']} skip={counts['skip']}")
+
+def parse_target_size(s: str, src_size: int) -> int:
+    """"40%" は元サイズ比、"500M" / "1.5G" / "800000" は絶対バイト数として解釈。"""
+    s = s.strip().upper()
+    if s.endswith("%"):
+        return int(src_size * float(s[:-1]) / 100)
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if s[-1:] in units:
+        return int(float(s[:-1]) * units[s[-1]])
+    return int(float(s))
+
+def sample_points(duration: float) -> list[tuple[float, float]]:
+    """試し打ちする (開始秒, 長さ) の一覧。短い動画は全体を1サンプルとする。"""
+    if duration <= SAMPLE_COUNT * SAMPLE_SEC * 2:
+        return [(0.0, duration)]
+    return [(duration * (i + 1) / (SAMPLE_COUNT + 1) - SAMPLE_SEC / 2, SAMPLE_SEC)
+            for i in range(SAMPLE_COUNT)]
+
+def measure_vmaf(distorted: Path, reference: Path, start: float, length: float) -> float:
+    """サンプル出力と元動画の同区間を libvmaf で比較し、平均VMAFを返す。"""
+    dist = ffmpeg.input(str(distorted)).video.filter("setpts", "PTS-STARTPTS")
+    ref = ffmpeg.input(str(reference), ss=start, t=length).video.filter("setpts", "PTS-STARTPTS")
+    # ログファイル経由だと Windows パスのフィルタ内エスケープが厄介なので stderr のサマリを読む
+    _, err = (
+        ffmpeg
+        .filter([dist, ref], "libvmaf")
+        .output("-", format="null")
+        .global_args("-hide_banner", "-nostdin", "-loglevel", "info")
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    m = re.search(r"VMAF score[:=]\s*([\d.]+)", err.decode("utf-8", errors="replace"))
+    if not m:
+        raise RuntimeError("VMAF スコアを取得できませんでした（ffmpeg が libvmaf 付きでビルドされているか確認）")
+    return float(m.group(1))
+
+def tune_crf(src: Path, info: ProbeInfo|None, args, vcodec: str, threads: int, work_dir: Path) -> tuple[int, str]:
+    """サンプルを候補CRFで試し打ちし、目標サイズ/品質を満たすCRFを推定。(crf, 説明) を返す。
+    vcodec は CRF_ENCODERS のいずれか（CLI で検査済み）。"""
+    if vcodec not in CRF_ENCODERS:
+        raise ValueError(f"{vcodec} は CRF に対応していないため自動調整できません")
+    duration = info.duration if info else 0.0
+    if duration <= 0:
+        return args.crf, "長さ不明のため既定CRF"
+
+    points = sample_points(duration)
+    sampled = sum(length for _, length in points)
+    xs: list[float] = []
+    ys: list[float] = []
+    for crf in CRF_CANDIDATES[args.codec]:
+        total_bytes = 0
+        scores = []
+        for k, (start, length) in enumerate(points):
+            out = work_dir / f"sample_{crf}_{k}.mp4"
+            compress_one(
+                src, out, vcodec, crf, args.preset, args.tune,
+                args.audio_copy, args.audio_bitrate, args.pix_fmt, False,
+                threads, start=start, length=length,
+            )
+            total_bytes += out.stat().st_size
+            if args.target_quality is not None:
+                scores.append(measure_vmaf(out, src, start, length))
+            out.unlink()
+        xs.append(crf)
+        if args.target_quality is not None:
+            ys.append(sum(scores) / len(scores))
+        else:
+            # サイズは CRF に対しておおむね指数的に減るので log を取って直線で当てはめる
+            ys.append(math.log(max(1, total_bytes) * duration / sampled))
+
+    slope, intercept = statistics.linear_regression(xs, ys)
+    lo, hi = CRF_RANGE[args.codec]
+    if slope >= 0:
+        return args.crf, "曲線を当てはめられないため既定CRF"
+    if args.target_quality is not None:
+        # VMAF >= 目標 となる最大のCRF
+        crf = math.floor((args.target_quality - intercept) / slope)
+        crf = min(hi, max(lo, crf))
+        return crf, f"予測VMAF {intercept + slope * crf:.1f}"
+    # 予測サイズ <= 目標 となる最小のCRF
+    target = parse_target_size(args.target_size, src.stat().st_size)
+    crf = math.ceil((math.log(max(1, target)) - intercept) / slope)
+    crf = min(hi, max(lo, crf))
+    return crf, f"予測 {human(math.exp(intercept + slope * crf))}"
+
+def split_at_keyframes(src: Path, work_dir: Path, duration: float, n: int) -> list[Path]:
+    """映像ストリームだけを -c copy で n 分割。segment muxer は指定時刻以降の最初のキーフレームで切る。"""
+    times = ",".join(f"{duration * i / n:.3f}" for i in range(1, n))
+    (
+        ffmpeg
+        .input(str(src))
+        .output(str(work_dir / "seg_%03d.mkv"), map="0:v:0", c="copy", f="segment",
+                segment_times=times, reset_timestamps=1, y=None)
+        .global_args("-hide_banner", "-nostdin", "-loglevel", "error")
+        .run()
+    )
+    return sorted(work_dir.glob("seg_*.mkv"))
+
+def concat_segments(parts: list[Path], src: Path, out_path: Path, work_dir: Path,
+                    audio_copy: bool, audio_bitrate: str|None, faststart: bool) -> None:
+    """エンコード済みセグメントを concat demuxer で無劣化連結し、元ファイルの音声を1回だけ多重化。"""
+    list_file = work_dir / "concat.txt"
+    # 同じディレクトリ内の相対名にしておけばパスのエスケープが不要
+    list_file.write_text("".join(f"file '{p.name}'\n" for p in parts), encoding="utf-8")
+
+    video = ffmpeg.input(str(list_file), f="concat", safe=0).video
+    audio = ffmpeg.input(str(src))["a?"]
+    out_kwargs = {
+        "vcodec": "copy",
+        "map_metadata": "1",
+        "movflags": "use_metadata_tags+faststart" if faststart else "use_metadata_tags",
+        "y": None,
+    }
+    if audio_copy:
+        out_kwargs["acodec"] = "copy"
+    else:
+        out_kwargs["acodec"] = "aac"
+        if audio_bitrate:
+            out_kwargs["b:a"] = audio_bitrate
+    (
+        ffmpeg
+        .output(video, audio, str(out_path), **out_kwargs)
+        .global_args("-hide_banner", "-nostdin", "-loglevel", "error")
         .run()
     )
 
+def chunked_encode(src: Path, out_path: Path, vcodec: str, crf: int, args, threads: int,
+                   duration: float, work_dir: Path, progress=None) -> dict[str, float]:
+    """長尺動画をキーフレーム分割 -> 並列エンコード -> 連結。フェーズごとの所要時間(ms)を返す。"""
+    phases = {}
+    t0 = time.time()
+    segments = split_at_keyframes(src, work_dir, duration, args.chunks)
+    phases["split"] = (time.time() - t0) * 1000
+
+    # ファイル単位に割り当てられたスレッド（未指定なら全コア）をセグメント間でさらに分ける
+    seg_threads = encode_threads(len(segments), threads or args.cores)
+    encoded = [seg.with_name(seg.stem + "_enc.mp4") for seg in segments]
+
+    def encode_segment(i: int) -> None:
+        compress_one(
+            segments[i], encoded[i], vcodec, crf, args.preset, args.tune,
+            True, None, args.pix_fmt, False, seg_threads,
+            progress=progress(i) if progress else None,
+        )
+
+    t0 = time.time()
+    # 各セグメントは別の ffmpeg プロセスでエンコードされる
+    with ThreadPoolExecutor(max_workers=max(1, len(segments))) as ex:
+        list(ex.map(encode_segment, range(len(segments))))
+    phases["encode"] = (time.time() - t0) * 1000
+
+    t0 = time.time()
+    concat_segments(encoded, src, out_path, work_dir, args.audio_copy, args.audio_bitrate, args.faststart)
+    phases["concat"] = (time.time() - t0) * 1000
+    return phases
+
 def is_video_file(p: Path) -> bool:
     return p.is_file() and p.suffix.lower() in VIDEO_EXTS
 
@@ -105,6 +488,403 @@ def plan_output_path(in_file: Path, out_dir: Path|None) -> Path:
         # 同じ場所に _compressed サフィックス
         return in_file.with_stem(in_file.stem + "_compressed").with_suffix(".mp4")
 
+def file_digest(p: Path) -> str:
+    """ファイル内容の BLAKE2b ハッシュ（16進）。"""
+    h = hashlib.blake2b(digest_size=20)
+    with open(p, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+def settings_key(args) -> str:
+    """出力に影響するエンコード設定を正規化した文字列。キャッシュキーの一部に使う。"""
+    if args.target_quality is not None:
+        crf = f"auto:vmaf={args.target_quality}"
+    elif args.target_size:
+        crf = f"auto:size={args.target_size}"
+    else:
+        crf = args.crf
+    return json.dumps({
+        "codec": args.codec,
+        "crf": crf,
+        "preset": args.preset,
+        "tune": args.tune,
+        "pix_fmt": args.pix_fmt,
+        "audio_copy": args.audio_copy,
+        "audio_bitrate": None if args.audio_copy else args.audio_bitrate,
+        "faststart": args.faststart,
+    }, sort_keys=True)
+
+class ResultCache:
+    """入力内容ハッシュ + 設定 -> 結果 を保持する SQLite キャッシュ。
+
+    ハッシュ自体も (パス, サイズ, mtime) で覚えておくため、未変更ファイルは再読込しない。
+    ワーカースレッドから呼ばれるので、DB アクセスはロックで直列化する。
+    """
+
+    def __init__(self, db_path: Path, key: str):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.key = key
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                digest TEXT, settings TEXT, status TEXT,
+                out_path TEXT, src_size INTEGER, out_size INTEGER, updated REAL,
+                PRIMARY KEY (digest, settings)
+            );
+            CREATE TABLE IF NOT EXISTS crf_choice (
+                digest TEXT, settings TEXT, crf INTEGER,
+                PRIMARY KEY (digest, settings)
+            );
+        """)
+        self.db.commit()
+
+    def digest(self, p: Path) -> str:
+        st = p.stat()
+        path = str(p.resolve())
+        with self.lock:
+            row = self.db.execute(
+                "SELECT digest FROM files WHERE path=? AND size=? AND mtime_ns=?",
+                (path, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+        if row:
+            return row[0]
+        d = file_digest(p)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, d),
+            )
+            self.db.commit()
+        return d
+
+    def get(self, digest: str) -> tuple[str, str|None, int, int]|None:
+        """(status, out_path, src_size, out_size) を返す。未登録なら None。"""
+        with self.lock:
+            return self.db.execute(
+                "SELECT status, out_path, src_size, out_size FROM results WHERE digest=? AND settings=?",
+                (digest, self.key),
+            ).fetchone()
+
+    def put(self, digest: str, status: str, out_path: Path|None, src_size: int, out_size: int) -> None:
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                # 出力パスは絶対パスで記録（相対/絶対どちらで入力を指定して再実行してもヒットするように）
+                (digest, self.key, status, str(out_path.resolve()) if out_path else None, src_size, out_size, time.time()),
+            )
+            self.db.commit()
+
+    def get_crf(self, digest: str) -> int|None:
+        """自動調整で決めたCRF。未登録なら None。"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT crf FROM crf_choice WHERE digest=? AND settings=?", (digest, self.key),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_crf(self, digest: str, crf: int) -> None:
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO crf_choice VALUES (?, ?, ?)", (digest, self.key, crf))
+            self.db.commit()
+
+    def close(self) -> None:
+        self.db.close()
+
+def cache_hit_message(src: Path, dst: Path, hit, force_replace: bool) -> str|None:
+    """キャッシュ結果が今回もそのまま使えるならスキップ理由を返す。"""
+    status, out_path, src_sz, out_sz = hit
+    if status == "ok":
+        # 出力が同じ場所に同じサイズで残っている場合のみ再利用
+        if out_path == str(dst.resolve()) and dst.exists() and dst.stat().st_size == out_sz:
+            return f"[CACHE] 変換済み: {src.name} -> {dst.name}"
+    elif status == "skip" and not force_replace:
+        return f"[CACHE] 前回サイズ悪化のため保留: {src.name} (src={human(src_sz)}, out={human(out_sz)})"
+    return None
+
+def _num(s: str|None) -> float:
+    """-progress の値（"N/A" や "2.31x" を含む）を float に。"""
+    try:
+        return float((s or "0").rstrip("x"))
+    except ValueError:
+        return 0.0
+
+def fmt_eta(sec: float|None) -> str:
+    if sec is None:
+        return "-"
+    sec = int(sec)
+    return f"{sec // 3600}:{sec % 3600 // 60:02d}:{sec % 60:02d}"
+
+class ProgressBoard:
+    """ffmpeg -progress の値をファイル別/全体で集計し、進捗率・fps・速度・ETA を表示する。
+
+    分割エンコード時はセグメントごと（sub）に報告され、ファイル単位に合算する。
+    json_path を指定すると同じ内容を JSON Lines で追記する。
+    """
+
+    def __init__(self, durations: dict[str, float], show: bool, json_path: Path|None):
+        self.durations = durations
+        self.total = sum(durations.values())
+        self.done = 0.0
+        self.active: dict[str, dict[int, dict]] = {}
+        self.last_emit: dict[str, float] = {}
+        self.show = show
+        self.json = open(json_path, "a", encoding="utf-8") if json_path else None
+        self.lock = threading.Lock()
+
+    def callback(self, key: str, sub: int = 0):
+        def on_progress(block: dict) -> None:
+            self.update(key, sub, block)
+        return on_progress
+
+    def update(self, key: str, sub: int, block: dict) -> None:
+        ended = block.get("progress") == "end"
+        with self.lock:
+            self.active.setdefault(key, {})[sub] = {
+                "t": _num(block.get("out_time_us")) / 1e6,
+                "fps": 0.0 if ended else _num(block.get("fps")),
+                "speed": 0.0 if ended else _num(block.get("speed")),
+            }
+            now = time.time()
+            if now - self.last_emit.get(key, 0) < PROGRESS_INTERVAL:
+                return
+            self.last_emit[key] = now
+            self._emit("progress", key)
+
+    def finish(self, key: str) -> None:
+        with self.lock:
+            self.active.pop(key, None)
+            self.done += self.durations.get(key, 0.0)
+            self._emit("end", key)
+
+    def close(self) -> None:
+        if self.json:
+            self.json.close()
+
+    def _emit(self, event: str, key: str) -> None:
+        # lock 保持中に呼ぶこと
+        subs = self.active.get(key, {}).values()
+        dur = self.durations.get(key, 0.0)
+        t = sum(v["t"] for v in subs)
+        fps = sum(v["fps"] for v in subs)
+        speed = sum(v["speed"] for v in subs)
+        all_subs = [v for f in self.active.values() for v in f.values()]
+        total_t = self.done + sum(v["t"] for v in all_subs)
+        total_fps = sum(v["fps"] for v in all_subs)
+        total_speed = sum(v["speed"] for v in all_subs)
+
+        if event == "end":
+            percent, eta = 100.0, 0.0
+        else:
+            percent = round(min(100.0, t / dur * 100), 1) if dur else None
+            eta = round(max(0.0, dur - t) / speed, 1) if dur and speed > 0 else None
+
+        rec = {
+            "ts": round(time.time(), 3),
+            "event": event,
+            "file": key,
+            "percent": percent,
+            "fps": round(fps, 1),
+            "speed": round(speed, 2),
+            "eta_s": eta,
+            "total_percent": round(min(100.0, total_t / self.total * 100), 1) if self.total else None,
+            "total_fps": round(total_fps, 1),
+            "total_speed": round(total_speed, 2),
+            "total_eta_s": round(max(0.0, self.total - total_t) / total_speed, 1) if self.total and total_speed > 0 else None,
+        }
+        if self.json:
+            self.json.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self.json.flush()
+        if self.show and event == "progress":
+            pct = f"{rec['percent']:5.1f}%" if rec["percent"] is not None else "    -"
+            tpct = f"{rec['total_percent']:5.1f}%" if rec["total_percent"] is not None else "-"
+            print(f"[PROG] {Path(key).name}  {pct}  fps={rec['fps']:.1f}  speed={rec['speed']:.2f}x  "
+                  f"ETA {fmt_eta(rec['eta_s'])} | 全体 {tpct}  fps={rec['total_fps']:.1f}  "
+                  f"ETA {fmt_eta(rec['total_eta_s'])}", flush=True)
+
+class Journal:
+    """1ファイル1行で処理結果を追記するジャーナル（JSON Lines）。
+
+    行ごとに flush + fsync するので、クラッシュしても書き終えた行は残る。
+    設定が異なる実行の記録は --resume の判定に使わない。
+    """
+
+    def __init__(self, path: Path, settings: str):
+        self.path = path
+        self.settings = hashlib.blake2b(settings.encode("utf-8"), digest_size=8).hexdigest()
+        self.lock = threading.Lock()
+        self.f = None
+
+    def finished(self, retry_failed: bool) -> set[str]:
+        """同じ設定で処理済み（成功/保留/失敗）の入力パス集合。retry_failed なら失敗は含めない。"""
+        last: dict[str, str] = {}
+        if not self.path.exists():
+            return set()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    # クラッシュ時の書きかけ行
+                    continue
+                if rec.get("settings") == self.settings:
+                    last[rec["src"]] = rec["status"]
+        return {src for src, status in last.items() if not (retry_failed and status == "err")}
+
+    def open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        torn = False
+        if self.path.exists() and self.path.stat().st_size > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self.f = open(self.path, "a", encoding="utf-8")
+        if torn:
+            # 書きかけ行の後ろに続けて書かないよう改行で区切る
+            self.f.write("\n")
+
+    def record(self, src: Path, dst: Path, status: str, msg: str) -> None:
+        rec = {
+            "ts": round(time.time(), 3),
+            "settings": self.settings,
+            "src": str(src.resolve()),
+            "dst": str(dst),
+            "status": status,
+            "msg": msg,
+        }
+        with self.lock:
+            self.f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+    def close(self) -> None:
+        if self.f:
+            self.f.close()
+
+def clean_scratch(dirs: set[Path]) -> int:
+    """前回クラッシュで残った作業ディレクトリを削除し、削除数を返す。"""
+    removed = 0
+    for d in dirs:
+        if not d.is_dir():
+            continue
+        for tmp in d.glob(SCRATCH_PREFIX + "*"):
+            if tmp.is_dir():
+                shutil.rmtree(tmp, ignore_errors=True)
+                removed += 1
+    return removed
+
+def encode_threads(jobs: int, cores: int) -> int:
+    """並列ジョブ1本あたりのスレッド数。jobs<=1 なら 0（ffmpeg任せ）を返す。"""
+    if jobs <= 1:
+        return 0
+    return max(1, cores // jobs)
+
+def process_one(src: Path, dst: Path, args, vcodec: str, threads: int,
+                cache: ResultCache|None = None, action: str = "encode",
+                info: ProbeInfo|None = None, progress=None) -> tuple[str, str, int]:
+    """1ファイルを圧縮（action="remux" なら詰め直し）してサイズガードを適用。
+    (状態, メッセージ, 節約バイト数) を返す。progress は sub番号 -> 進捗コールバック を返す関数。"""
+    digest = None
+    if cache:
+        try:
+            digest = cache.digest(src)
+            hit = cache.get(digest)
+            msg = cache_hit_message(src, dst, hit, args.force_replace) if hit else None
+            if msg:
+                return "cached", msg, 0
+        except (OSError, sqlite3.Error) as e:
+            print(f"[WARN] キャッシュ参照に失敗: {src.name}: {e}", file=sys.stderr)
+            digest = None
+
+    # 作業ファイルは出力先と同じファイルシステムに置き、確定をリネーム1回で済ませる
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=SCRATCH_PREFIX, dir=dst.parent))
+    tmp_out = tmp_dir / (dst.name + ".tmp.mp4")
+
+    try:
+        crf = args.crf
+        note = ""
+        if action != "remux" and (args.target_size or args.target_quality is not None):
+            cached_crf = cache.get_crf(digest) if cache and digest else None
+            if cached_crf is not None:
+                crf, note = cached_crf, f"crf={cached_crf} (cache)"
+            else:
+                if info is None:
+                    info = probe_video(src)
+                crf, why = tune_crf(src, info, args, vcodec, threads, tmp_dir)
+                note = f"crf={crf}, {why}"
+                if cache and digest:
+                    cache.put_crf(digest, crf)
+
+        t0 = time.time()
+        if action == "remux":
+            try:
+                remux_one(src, tmp_out)
+            except ffmpeg.Error:
+                # mp4 に入らないストリーム（PCM 音声など）は詰め直せないので、通常の再エンコードに切り替える
+                action = "encode"
+                note = ", ".join(filter(None, [note, "remux不可のため再エンコード"]))
+
+        if action != "remux":
+            use_chunks = False
+            if args.chunks > 1:
+                if info is None:
+                    info = probe_video(src)
+                use_chunks = info.duration >= args.chunk_min_sec
+            if use_chunks:
+                phases = chunked_encode(src, tmp_out, vcodec, crf, args, threads, info.duration, tmp_dir, progress)
+                note = ", ".join(filter(None, [note, " / ".join(f"{k} {v:.0f} ms" for k, v in phases.items())]))
+            else:
+                compress_one(
+                    src, tmp_out, vcodec, crf, args.preset, args.tune,
+                    args.audio_copy, args.audio_bitrate, args.pix_fmt, args.faststart,
+                    threads, progress=progress(0) if progress else None,
+                )
+        enc_ms = (time.time() - t0) * 1000
+
+        src_sz = src.stat().st_size
+        out_sz = tmp_out.stat().st_size
+
+        # サイズ悪化時のガード（リマックスはサイズ目的ではないので対象外）
+        if action != "remux" and not args.force_replace and out_sz >= src_sz:
+            if cache and digest:
+                cache.put(digest, "skip", None, src_sz, out_sz)
+            return "skip", f"[SKIP] 大きくなったため保留: {src.name} (src={human(src_sz)}, out={human(out_sz)}{', ' + note if note else ''})", 0
+
+        os.replace(tmp_out, dst)
+        saved = max(0, src_sz - out_sz)
+        if cache and digest:
+            cache.put(digest, "ok", dst, src_sz, out_sz)
+        tag = "[REMUX]" if action == "remux" else "[OK]"
+        return "ok", f"{tag} {src.name} -> {dst.name}  {human(src_sz)} -> {human(out_sz)}  (saved {human(saved)}, {enc_ms:.0f} ms{', ' + note if note else ''})", saved
+    except ffmpeg.Error as e:
+        stderr_msg = ""
+        if hasattr(e, 'stderr') and e.stderr:
+            stderr_msg = e.stderr.decode('utf-8', errors='replace')
+        return "err", f"[ERR] {src.name}: ffmpeg error - {stderr_msg}", 0
+    except Exception as e:
+        return "err", f"[ERR] {src.name}: {e}", 0
+    finally:
+        # 一時ディレクトリ削除
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+
+def run_jobs(tasks: list[tuple[Path, Path]], jobs: int, worker):
+    """(src, dst) を最大 jobs 本ずつ並列に処理し、完了順に結果を返すスケジューラ。"""
+    if jobs <= 1:
+        for src, dst in tasks:
+            yield worker(src, dst)
+        return
+    # ffmpeg は別プロセスなのでスレッドで十分（GILはwait中に解放される）
+    with ThreadPoolExecutor(max_workers=jobs) as ex:
+        futures = [ex.submit(worker, src, dst) for src, dst in tasks]
+        for fut in as_completed(futures):
+            yield fut.result()
+
 def main():
     parser = argparse.ArgumentParser(
         description="Loss-minimized video compression via ffmpeg-python."
@@ -114,7 +894,7 @@ def main():
     parser.add_argument("--codec", choices=["h264","hevc","av1"], default="h264", help="映像コーデック（既定: h264）")
     parser.add_argument("--crf", type=int, default=23, help="CRF（小さいほど高画質/大容量, 目安: 18〜28）")
     parser.add_argument("--preset", default="medium",
-                        choices=["ultrafast","superfast","veryfast","faster","fast","medium","slow","slower","veryslow"],
+                        choices=PRESETS,
                         help="圧縮速度/効率（既定: medium）")
     parser.add_argument("--tune", default=None, help="ffmpegのtune(e.g. film, animation, grain)")
     parser.add_argument("--audio-copy", action="store_true", default=True, help="音声を再エンコードせずcopy（既定）")
@@ -124,17 +904,54 @@ def main():
     parser.add_argument("--faststart", action="store_true", help="mp4のfaststartを有効（Web配信用に先頭へmoov移動）")
     parser.add_argument("--force-replace", action="store_true", help="圧縮後が大きくても置換する（既定はサイズ悪化なら保留）")
     parser.add_argument("--dry-run", action="store_true", help="実際には書き出さず、処理対象と出力パスのみ表示")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="同時に実行する ffmpeg の数（既定: 1）")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 1,
+                        help="並列時にジョブ間で分割するCPUコア数（既定: 論理CPU数）")
+    parser.add_argument("--cache-db", default=None,
+                        help=f"結果キャッシュのパス（既定: 出力先ディレクトリ、未指定なら入力側に {CACHE_NAME}）")
+    parser.add_argument("--no-cache", action="store_true", help="結果キャッシュを使わず常に再エンコード")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--target-size", default=None,
+                        help="ファイルごとの目標サイズ（例: 40%%=元の40%%, 500M）。サンプル試し打ちでCRFを自動決定（--codec hevc / av1 のみ）")
+    target.add_argument("--target-quality", type=float, default=None,
+                        help="目標VMAF（例: 93）。満たす範囲で最大のCRFを自動決定（libvmaf 付き ffmpeg が必要, --codec hevc / av1 のみ）")
+    parser.add_argument("--chunks", type=int, default=1,
+                        help="長尺動画をキーフレームで N 分割して並列エンコード（既定: 1 = 分割しない）")
+    parser.add_argument("--chunk-min-sec", type=float, default=600,
+                        help="分割エンコードの対象とする最小の長さ（秒, 既定: 600）")
+    parser.add_argument("--progress", action="store_true",
+                        help="エンコード中の進捗（fps/速度/進捗率/ETA）を逐次表示")
+    parser.add_argument("--progress-json", default=None,
+                        help="進捗を JSON Lines で追記するファイル（スケジューラ等からの取得用）")
+    parser.add_argument("--journal", default=None,
+                        help=f"ジャーナルのパス（既定: キャッシュと同じ場所の {JOURNAL_NAME}）")
+    parser.add_argument("--resume", action="store_true",
+                        help="ジャーナルに記録済み（同じ設定）のファイルを飛ばして続きから処理")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="--resume 時、前回失敗したファイルは再処理する")
+    parser.add_argument("--no-plan", action="store_true",
+                        help="事前の ffprobe による計画（縮まない見込みのファイルのスキップ/リマックス）を行わない")
 
     args = parser.parse_args()
+    if args.target_size:
+        try:
+            parse_target_size(args.target_size, 1)
+        except ValueError:
+            parser.error(f"--target-size の形式が不正です: {args.target_size}")
 
     in_path = Path(args.input)
     out_dir = Path(args.output_dir).resolve() if args.output_dir else None
     vcodec = CODEC_MAP[args.codec]
+    if (args.target_size or args.target_quality is not None) and vcodec not in CRF_ENCODERS:
+        # 試し打ちのサイズ/品質が CRF で変わらず、当てはめが失敗するか無意味な CRF がキャッシュされるだけなので拒否する
+        parser.error(f"--codec {args.codec} のエンコーダ {vcodec} は CRF に対応していないため、"
+                     f"--target-size / --target-quality は使えません（--codec hevc / av1 を指定してください）")
 
     targets: list[Path] = []
     if in_path.is_dir():
         for p in sorted(in_path.rglob("*")):
-            if is_video_file(p):
+            # 中断した実行の作業ファイルは拾わない
+            if is_video_file(p) and not any(part.startswith(SCRATCH_PREFIX) for part in p.parts):
                 targets.append(p)
     elif is_video_file(in_path):
         targets.append(in_path)
@@ -146,54 +963,95 @@ def main():
         print("処理対象となる動画が見つかりませんでした。", file=sys.stderr)
         sys.exit(3)
 
-    print(f"[INFO] 対象 {len(targets)} 件 / codec={args.codec}, crf={args.crf}, preset={args.preset}, audio_copy={args.audio_copy}")
+    state_dir = out_dir or (in_path if in_path.is_dir() else in_path.parent)
+    journal = Journal(Path(args.journal) if args.journal else state_dir / JOURNAL_NAME, settings_key(args))
+    if args.resume:
+        finished = journal.finished(args.retry_failed)
+        before = len(targets)
+        targets = [src for src in targets if str(src.resolve()) not in finished]
+        removed = 0 if args.dry_run else clean_scratch({plan_output_path(src, out_dir).parent for src in targets})
+        print(f"[RESUME] 処理済み {before - len(targets)} 件をスキップ（残り {len(targets)} 件, 作業ディレクトリ掃除 {removed} 件）")
+        if not targets:
+            print("\n[完了] 未処理のファイルはありません。")
+            return
 
-    total_saved = 0
-    processed = 0
-    for src in targets:
-        dst = plan_output_path(src, out_dir)
-        if args.dry_run:
+    jobs = max(1, args.jobs)
+    threads = encode_threads(jobs, args.cores)
+    if jobs > 1:
+        # 大きいファイルから投入して最後に長時間ジョブが1本だけ残るのを防ぐ
+        targets.sort(key=lambda p: p.stat().st_size, reverse=True)
+
+    crf_label = "auto" if (args.target_size or args.target_quality is not None) else args.crf
+    print(f"[INFO] 対象 {len(targets)} 件 / codec={args.codec}, crf={crf_label}, preset={args.preset}, audio_copy={args.audio_copy}"
+          + (f", jobs={jobs}, threads/job={threads}" if jobs > 1 else ""))
+
+    plans: dict[Path, tuple[str, str]] = {}
+    infos: dict[Path, ProbeInfo|None] = {}
+    if not args.no_plan:
+        infos = probe_all(targets)
+        plans = {src: plan_action(infos[src], args) for src in targets}
+        print_plan(plans, infos)
+        skipped = [(src, reason) for src, (action, reason) in plans.items() if action == "skip"]
+        if skipped and not args.dry_run:
+            journal.open()
+        for src, reason in skipped:
+            msg = f"[SKIP] 縮まない見込みのため対象外: {src.name} ({reason})"
+            print(msg)
+            if not args.dry_run:
+                journal.record(src, plan_output_path(src, out_dir), "skip", msg)
+        targets = [src for src in targets if plans[src][0] != "skip"]
+
+    tasks = [(src, plan_output_path(src, out_dir)) for src in targets]
+    if args.dry_run:
+        for src, dst in tasks:
             print(f"DRY-RUN: {src} -> {dst}")
-            continue
+        tasks = []
 
-        tmp_dir = Path(tempfile.mkdtemp(prefix="ffx_"))
-        tmp_out = tmp_dir / (dst.name + ".tmp.mp4")
+    board = None
+    if tasks and (args.progress or args.progress_json):
+        if not infos:
+            infos = probe_all(targets)
+        durations = {str(src): (infos[src].duration if infos.get(src) else 0.0) for src in targets}
+        board = ProgressBoard(durations, args.progress, Path(args.progress_json) if args.progress_json else None)
 
+    cache = None
+    if tasks and not args.no_cache:
+        cache_path = Path(args.cache_db) if args.cache_db else state_dir / CACHE_NAME
+        cache = ResultCache(cache_path, settings_key(args))
+    if tasks and not journal.f:
+        journal.open()
+
+    total_saved = 0
+    processed = 0
+    cached = 0
+
+    def worker(src: Path, dst: Path):
+        action = plans.get(src, ("encode", ""))[0]
+        progress = (lambda sub: board.callback(str(src), sub)) if board else None
         try:
-            t0 = time.time()
-            compress_one(
-                src, tmp_out, vcodec, args.crf, args.preset, args.tune,
-                args.audio_copy, args.audio_bitrate, args.pix_fmt, args.faststart
-            )
-            enc_ms = (time.time() - t0) * 1000
-
-            src_sz = src.stat().st_size
-            out_sz = tmp_out.stat().st_size
-
-            # サイズ悪化時のガード
-            if not args.force_replace and out_sz >= src_sz:
-                print(f"[SKIP] 大きくなったため保留: {src.name} (src={human(src_sz)}, out={human(out_sz)})")
-                continue
-
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            shutil.move(str(tmp_out), str(dst))
-            saved = src_sz - out_sz
-            total_saved += max(0, saved)
-            processed += 1
-            print(f"[OK] {src.name} -> {dst.name}  {human(src_sz)} -> {human(out_sz)}  (saved {human(max(0,saved))}, {enc_ms:.0f} ms)")
-        except ffmpeg.Error as e:
-            stderr_msg = ""
-            if hasattr(e, 'stderr') and e.stderr:
-                stderr_msg = e.stderr.decode('utf-8', errors='replace')
-            print(f"[ERR] {src.name}: ffmpeg error - {stderr_msg}")
-        except Exception as e:
-            print(f"[ERR] {src.name}: {e}")
+            result = process_one(src, dst, args, vcodec, threads, cache, action, infos.get(src), progress)
+            journal.record(src, dst, result[0], result[1])
+            return result
         finally:
-            # 一時ディレクトリ削除
-            if tmp_dir.exists():
-                shutil.rmtree(tmp_dir)
+            if board:
+                board.finish(str(src))
+
+    try:
+        for status, msg, saved in run_jobs(tasks, jobs, worker):
+            print(msg)
+            if status == "ok":
+                total_saved += saved
+                processed += 1
+            elif status == "cached":
+                cached += 1
+    finally:
+        if cache:
+            cache.close()
+        if board:
+            board.close()
+        journal.close()
 
-    print(f"\n[完了] {processed} ファイル処理完了。合計節約サイズ: {human(total_saved)}")
+    print(f"\n[完了] {processed} ファイル処理完了（キャッシュ済み {cached} 件）。合計節約サイズ: {human(total_saved)}")
 
 if __name__ == "__main__":
     main()
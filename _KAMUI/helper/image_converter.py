@@ -9,6 +9,27 @@ image_converter.py
 - デフォルトは JPEG 形式で保存します。
 - HEIC/HEIF に対応するため pillow-heif を利用しています。
 - PNG/WebP などアルファチャンネルを持つ形式を JPEG に変換する場合は、背景色で合成します。
+- --jobs N で N プロセス並列に変換します（HEIC デコードや JPEG 最適化は CPU 律速のため）。
+  タスクは --chunksize 件ずつまとめて渡し、結果は入力順（既定）か --unordered で完了順に表示します。
+  1ファイルの失敗はそのファイルの [ERR] になるだけで他は続行します。ワーカープロセスが異常終了した場合は、
+  巻き込まれたチャンクを1ファイルずつ別プロセスでやり直し、落ちたファイルだけを [ERR] にします。
+- --max-size N（長辺 N px 以下）/ --scale F（倍率）で縮小して保存します。JPEG は draft モード（DCT 段階での
+  1/2・1/4・1/8 縮小デコード）、HEIC は埋め込みサムネイルを使って必要な解像度だけデコードし、
+  最終サイズへは1回のリサンプルで縮小、EXIF の回転は縮小後の小さい画像に適用します。
+- --to はカンマ区切りで複数形式を指定でき、形式ごとに :品質 を付けられます（例: JPEG:85,WEBP:80,AVIF:60）。
+  --sizes 320,640,1280 のようにサイズ段（長辺px）を指定すると *_converted_{サイズ}.{拡張子} を書き出します。
+  元画像は1回だけデコードし、全サイズ・全形式をその画像から作ってスレッド並列でエンコードします。
+  元画像より大きいサイズ段は拡大せず、元画像を含む最小の段だけ原寸で書き出します。
+- 変換結果をマニフェスト（出力先、未指定なら入力側の .image_converter_manifest.sqlite）に
+  (入力パス, サイズ, mtime, 内容ハッシュ, 設定) -> 出力 として記録し、再実行時は未変更のファイルをスキップします。
+  サイズ/mtime が一致すればハッシュも計算しない（stat だけで判定）ので、大半が未変更のライブラリでもすぐ終わります。
+  入力が削除された出力は [STALE] として報告し、--prune で削除します（--force で全件再変換, --no-manifest で無効化）。
+- --recompress で保存後に可逆の再圧縮を試し、最も小さい結果を残します（外部ツール不要）。
+    * PNG: 行フィルタ（None/Sub/Up/Average/Paeth/行ごと適応）× zlib 戦略（default/filtered/RLE）を総当たり
+    * JPEG: 同じ画素・同じ量子化のまま、ハフマン最適化 × プログレッシブ/ベースラインの組み合わせを比較。
+      Pillow で選べるのはこの2つだけなので、既定（最適化+プログレッシブ）ではベースラインとの比較1通り、
+      --no-progressive では試行なしになり、削減はほぼ期待できません（開始時に [INFO] で表示します）
+  試行時間は入力1画像あたり --recompress-budget 秒まで（その画像の全形式・全サイズで共有）。ファイルごと・合計の削減バイト数を表示します。
 
 注意事項:
 - このスクリプトは Windows 環境（Git Bash, PowerShell 等）でも利用可能です。
@@ -22,7 +43,20 @@ import sys
 sys.stdout.reconfigure(encoding="utf-8")
 
 import argparse
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
 from pathlib import Path
+import numpy as np
 from PIL import Image, ImageOps
 import pillow_heif   # HEIC/HEIF対応のためインポートするだけで有効になる
 
@@ -32,54 +66,498 @@ pillow_heif.register_heif_opener()
 # 対応画像拡張子
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff", ".heic", ".heif"}
 
+MANIFEST_NAME = ".image_converter_manifest.sqlite"
+HASH_CHUNK = 1 << 20
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG カラータイプ -> 1画素のチャンネル数（ビット深度 8 のみ再圧縮する）
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# 試す順序（効きやすいものから。時間切れになったら残りは試さない）
+PNG_FILTERS = ("adaptive", "paeth", "none", "sub", "up", "average")
+ZLIB_STRATEGIES = (zlib.Z_FILTERED, zlib.Z_DEFAULT_STRATEGY, zlib.Z_RLE)
+# 行フィルタの番号（adaptive は行ごとにこの5種から選ぶ）
+PNG_FILTER_TYPES = {"none": 0, "sub": 1, "up": 2, "average": 3, "paeth": 4}
+# フィルタ・圧縮は行の帯ごとに行う（1帯あたりの行バイト数の目安。作業メモリがこれに比例して頭打ちになる）
+PNG_BAND_BYTES = 1 << 20
+# これより画素数が多い画像は総当たりせず、adaptive で軽い RLE → 先頭の戦略の順に2通りだけ試す
+PNG_SEARCH_MAX_PIXELS = 4_000_000
+
+def human(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
 def is_image_file(p: Path) -> bool:
     return p.is_file() and p.suffix.lower() in IMAGE_EXTS
 
-def plan_output_path(in_file: Path, out_dir: Path|None, fmt: str) -> Path:
+@dataclass(frozen=True)
+class Variant:
+    """出力1種類分の指定。size はサイズ段の長辺px（None なら --max-size / --scale か原寸）。"""
+    fmt: str
+    quality: int|None
+    size: int|None = None
+
+def parse_formats(spec: str, default_quality: int) -> list[tuple[str, int|None]]:
+    """"JPEG:85,WEBP:80,AVIF" を [(形式, 品質), ...] に。品質省略時は JPEG のみ default_quality。"""
+    result = []
+    for item in spec.split(","):
+        name, _, q = item.strip().partition(":")
+        fmt = name.strip().upper().replace("JPG", "JPEG")
+        if not fmt:
+            continue
+        if any(f == fmt for f, _ in result):
+            raise ValueError(f"形式が重複しています: {fmt}")
+        quality = int(q) if q else (default_quality if fmt == "JPEG" else None)
+        result.append((fmt, quality))
+    if not result:
+        raise ValueError("出力形式が指定されていません")
+    return result
+
+def plan_output_path(in_file: Path, out_dir: Path|None, fmt: str, size: int|None = None) -> Path:
     """出力パスを決定"""
     ext = "." + fmt.lower().replace("jpeg", "jpg")
+    stem = in_file.stem + "_converted" + (f"_{size}" if size else "")
     if out_dir:
         out_dir.mkdir(parents=True, exist_ok=True)
-        return out_dir / (in_file.stem + "_converted" + ext)
+        return out_dir / (stem + ext)
     else:
-        return in_file.with_stem(in_file.stem + "_converted").with_suffix(ext)
+        return in_file.with_name(stem + ext)
+
+def plan_outputs(in_file: Path, out_dir: Path|None, variants: list[Variant]) -> list[tuple[Variant, Path]]:
+    return [(v, plan_output_path(in_file, out_dir, v.fmt, v.size)) for v in variants]
+
+def target_size(size: tuple[int,int], max_size: int|None, scale: float|None) -> tuple[int,int]|None:
+    """縮小後のサイズ。縮小不要（拡大になる/指定なし）なら None。"""
+    w, h = size
+    if max_size:
+        r = max_size / max(w, h)
+    elif scale:
+        r = scale
+    else:
+        return None
+    if r >= 1:
+        return None
+    return max(1, round(w * r)), max(1, round(h * r))
+
+def png_chunks(data: bytes) -> list[tuple[bytes, bytes]]:
+    """PNG を (チャンク種別, 本体) の並びに分解。"""
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("PNG ではありません")
+    chunks, pos = [], len(PNG_SIGNATURE)
+    while pos < len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        chunks.append((kind, data[pos + 8:pos + 8 + length]))
+        pos += 12 + length
+    return chunks
+
+def png_filter_band(x: np.ndarray, prev: np.ndarray, bpp: int, name: str) -> np.ndarray:
+    """行の帯 x（uint8, (行数, 行バイト数)）を行フィルタ name で変換し、先頭にフィルタ番号を付けて返す。
+    prev は帯の直前の行（先頭の帯ではゼロ）。"""
+    x16 = x.astype(np.int16)
+    up = np.vstack([prev[None].astype(np.int16), x16[:-1]])
+    left = np.zeros_like(x16)
+    left[:, bpp:] = x16[:, :-bpp]
+
+    def apply(ftype: int) -> np.ndarray:
+        if ftype == 0:
+            return x
+        if ftype == 1:
+            r = x16 - left
+        elif ftype == 2:
+            r = x16 - up
+        elif ftype == 3:
+            r = x16 - ((left + up) >> 1)
+        else:
+            upleft = np.zeros_like(x16)
+            upleft[:, bpp:] = up[:, :-bpp]
+            p = left + up - upleft
+            pa, pb, pc = np.abs(p - left), np.abs(p - up), np.abs(p - upleft)
+            r = x16 - np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, upleft))
+        return (r & 0xFF).astype(np.uint8)
+
+    if name == "adaptive":
+        # 行ごとに「符号付きとみなした絶対値の和」が最小のフィルタを選ぶ（libpng と同じ経験則）
+        stack = np.stack([apply(t) for t in range(5)])
+        body = stack.astype(np.int16)
+        types = np.minimum(body, 256 - body).sum(axis=2).argmin(axis=0)
+        rows = stack[types, np.arange(x.shape[0])]
+    else:
+        ftype = PNG_FILTER_TYPES[name]
+        types = np.full(x.shape[0], ftype)
+        rows = apply(ftype)
+    return np.hstack([types.astype(np.uint8)[:, None], rows])
+
+def png_idat(px: np.ndarray, bpp: int, name: str, strategy: int, deadline: float) -> bytes|None:
+    """行フィルタ name と zlib 戦略 strategy で IDAT の中身を作る。帯ごとにフィルタしてそのまま圧縮に流すので、
+    作業メモリは帯の大きさ程度。途中で deadline を過ぎたら None。"""
+    band = max(1, PNG_BAND_BYTES // px.shape[1])
+    comp = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+    parts = []
+    prev = np.zeros(px.shape[1], np.uint8)
+    for y in range(0, px.shape[0], band):
+        if time.perf_counter() > deadline:
+            return None
+        x = px[y:y + band]
+        parts.append(comp.compress(png_filter_band(x, prev, bpp, name).tobytes()))
+        prev = x[-1]
+    parts.append(comp.flush())
+    return b"".join(parts)
+
+def recompress_png(data: bytes, deadline: float) -> bytes:
+    """PNG の行フィルタと zlib 戦略を総当たりして最小のものを返す（画素は不変）。
+    ビット深度 8 以外・インターレースは対象外でそのまま返す。大きい画像（PNG_SEARCH_MAX_PIXELS 超）は
+    adaptive × (RLE, 先頭の戦略) だけを試す。試行は1通りずつ帯単位で行い、時間切れの時点で打ち切る。"""
+    chunks = png_chunks(data)
+    width, height, depth, ctype, _, _, interlace = struct.unpack(">IIBBBBB", chunks[0][1])
+    if depth != 8 or interlace or ctype not in PNG_CHANNELS:
+        return data
+    with Image.open(io.BytesIO(data)) as im:
+        px = np.asarray(im).reshape(height, width * PNG_CHANNELS[ctype])
+
+    trials = [(name, strategy) for name in PNG_FILTERS for strategy in ZLIB_STRATEGIES]
+    if width * height > PNG_SEARCH_MAX_PIXELS:
+        trials = [("adaptive", zlib.Z_RLE), trials[0]]
+
+    best = data
+    for name, strategy in trials:
+        if time.perf_counter() > deadline:
+            break
+        idat = png_idat(px, PNG_CHANNELS[ctype], name, strategy, deadline)
+        if idat is None:
+            break
+        # IDAT 以外のチャンク（PLTE, tRNS, iCCP, eXIf 等）はそのまま残す
+        out = [PNG_SIGNATURE]
+        for kind, body in chunks:
+            if kind == b"IDAT":
+                if idat is None:
+                    continue
+                body, idat = idat, None
+            out.append(struct.pack(">I4s", len(body), kind) + body
+                       + struct.pack(">I", zlib.crc32(kind + body)))
+        candidate = b"".join(out)
+        if len(candidate) < len(best):
+            best = candidate
+    if best is not data:
+        # 念のため画素が一致することを確認してから採用する
+        with Image.open(io.BytesIO(best)) as im:
+            if not np.array_equal(np.asarray(im).reshape(px.shape), px):
+                return data
+    return best
+
+def jpeg_candidates(save_kwargs: dict) -> list[dict]:
+    """再圧縮で試す JPEG の保存設定（save_kwargs と同じものは除く）。
+    画素・量子化を変えずに Pillow で選べるのはハフマン最適化とプログレッシブ有無だけ。
+    progressive=False 指定時はベースラインのみ。"""
+    candidates = []
+    for progressive in ((True, False) if save_kwargs.get("progressive") else (False,)):
+        kwargs = dict(save_kwargs, optimize=True, progressive=progressive)
+        if kwargs != save_kwargs:
+            candidates.append(kwargs)
+    return candidates
+
+def recompress_jpeg(im: Image.Image, save_kwargs: dict, data: bytes, deadline: float) -> bytes:
+    """jpeg_candidates の設定で保存し直して最小のものを返す。量子化後の係数は同一なので画質は変わらない。"""
+    best = data
+    for kwargs in jpeg_candidates(save_kwargs):
+        if time.perf_counter() > deadline:
+            break
+        buf = io.BytesIO()
+        im.save(buf, "JPEG", **kwargs)
+        if buf.tell() < len(best):
+            best = buf.getvalue()
+    return best
+
+def save_variant(
+    im: Image.Image,
+    variant: Variant,
+    out_path: Path,
+    background: tuple[int,int,int],
+    keep_exif: bool,
+    optimize: bool,
+    progressive: bool,
+    deadline: float|None = None,
+) -> int:
+    """縮小・回転済みの画像を1形式で保存。失敗時は例外送出。
+    deadline（time.perf_counter の時刻）を指定すると、それまで PNG/JPEG を可逆に再圧縮し、削減バイト数を返す。"""
+    fmt = variant.fmt
+    # 透過をJPEGへ変換する場合は背景合成
+    if fmt == "JPEG" and im.mode in ("RGBA", "LA"):
+        bg = Image.new("RGB", im.size, background)
+        bg.paste(im, mask=im.split()[-1])
+        im = bg
+    elif fmt == "JPEG" and im.mode not in ("RGB", "L"):
+        im = im.convert("RGB")
+
+    save_kwargs = {}
+    if fmt == "JPEG":
+        save_kwargs.update(dict(quality=variant.quality, optimize=optimize, progressive=progressive))
+    elif variant.quality is not None:
+        save_kwargs["quality"] = variant.quality
+
+    # EXIFとICCを保持（必要に応じて）
+    exif = im.info.get("exif")
+    icc = im.info.get("icc_profile")
+    if keep_exif and exif:
+        save_kwargs["exif"] = exif
+    if icc:
+        save_kwargs["icc_profile"] = icc
+
+    # 同じ画像の先の出力で期限を使い切っていたら、再圧縮せずにそのまま保存する
+    if deadline is None or fmt not in ("PNG", "JPEG") or time.perf_counter() > deadline:
+        im.save(out_path, fmt, **save_kwargs)
+        return 0
+
+    buf = io.BytesIO()
+    im.save(buf, fmt, **save_kwargs)
+    data = buf.getvalue()
+    if fmt == "PNG":
+        best = recompress_png(data, deadline)
+    else:
+        best = recompress_jpeg(im, save_kwargs, data, deadline)
+    out_path.write_bytes(best)
+    return len(data) - len(best)
 
 def convert_one(
     in_path: Path,
-    out_path: Path,
-    fmt: str,
-    quality: int,
+    outputs: list[tuple[Variant, Path]],
     background: tuple[int,int,int],
     keep_exif: bool,
     optimize: bool,
     progressive: bool,
-) -> None:
-    """1ファイルを変換。失敗時は例外送出。"""
+    max_size: int|None = None,
+    scale: float|None = None,
+    threads: int = 1,
+    recompress_budget: float|None = None,
+) -> tuple[list[Path], int]:
+    """1ファイルを1回だけデコードし、outputs の全形式・全サイズを書き出す。
+    (書き出したパス, 再圧縮で削減したバイト数) を返す。
+    max_size / scale 指定時は縮小して保存。失敗時は例外送出（成功した出力は残る）。
+    recompress_budget（秒）は再圧縮の試行時間で、この画像の全出力で共有する。"""
     with Image.open(in_path) as im:
-        # EXIFの回転情報を適用
-        im = ImageOps.exif_transpose(im)
-
-        # 透過をJPEGへ変換する場合は背景合成
-        if fmt.upper() == "JPEG" and im.mode in ("RGBA", "LA"):
-            bg = Image.new("RGB", im.size, background)
-            bg.paste(im, mask=im.split()[-1])
-            im = bg
-        elif fmt.upper() == "JPEG" and im.mode not in ("RGB", "L"):
-            im = im.convert("RGB")
-
-        save_kwargs = {}
-        if fmt.upper() == "JPEG":
-            save_kwargs.update(dict(quality=quality, optimize=optimize, progressive=progressive))
-
-        # EXIFとICCを保持（必要に応じて）
-        exif = im.info.get("exif")
-        icc = im.info.get("icc_profile")
-        if keep_exif and exif:
-            save_kwargs["exif"] = exif
-        if icc:
-            save_kwargs["icc_profile"] = icc
-
-        im.save(out_path, fmt.upper(), **save_kwargs)
+        long_side = max(im.size)
+        # 元画像を含む最小のサイズ段だけ原寸で書き、それより大きい段は作らない（拡大しない）
+        cover = min((v.size for v, _ in outputs if v.size and v.size >= long_side), default=None)
+        jobs = []
+        for v, dst in outputs:
+            if v.size and v.size >= long_side and v.size != cover:
+                continue
+            target = target_size(im.size, v.size, None) if v.size else target_size(im.size, max_size, scale)
+            jobs.append((v, dst, target))
+        targets = {t for _, _, t in jobs}
+
+        if targets and None not in targets:
+            # デコード前に縮小デコードを要求（JPEG: DCT スケーリング, HEIC: 埋め込みサムネイル）。
+            # 最大のサイズ以上で戻るので、各サイズへは1回のリサンプルで縮める
+            im.draft(im.mode, max(targets))
+        im.load()
+
+        # EXIFの回転情報を適用（縮小後の小さい画像に対して行う）
+        bases = {}
+        for t in targets:
+            bases[t] = ImageOps.exif_transpose(im.resize(t, Image.Resampling.LANCZOS) if t else im)
+
+    # 再圧縮の期限は画像単位。形式・サイズ違いの出力はすべて同じ期限までに試行を終える
+    deadline = time.perf_counter() + recompress_budget if recompress_budget is not None else None
+
+    def encode(job) -> tuple[int, str|None]:
+        v, dst, t = job
+        try:
+            return save_variant(bases[t], v, dst, background, keep_exif, optimize, progressive,
+                                deadline), None
+        except Exception as e:
+            return 0, f"{dst.name}: {e}"
+
+    # Pillow のエンコーダは GIL を解放するので、形式・サイズ違いはスレッドで並列にエンコードする
+    if threads > 1 and len(jobs) > 1:
+        with ThreadPoolExecutor(max_workers=min(threads, len(jobs))) as ex:
+            results = list(ex.map(encode, jobs))
+    else:
+        results = [encode(job) for job in jobs]
+    failed = [e for _, e in results if e]
+    if failed:
+        raise RuntimeError("; ".join(failed))
+    return [dst for _, dst, _ in jobs], sum(saved for saved, _ in results)
+
+def file_digest(p: Path) -> str:
+    """ファイル内容の BLAKE2b ハッシュ（16進）。"""
+    h = hashlib.blake2b(digest_size=20)
+    with open(p, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+def settings_key(variants: list[Variant], opts: dict) -> str:
+    """出力に影響する設定を正規化した文字列。マニフェストの一致判定に使う。"""
+    return json.dumps({
+        "variants": [[v.fmt, v.quality, v.size] for v in variants],
+        **{k: opts[k] for k in ("background", "keep_exif", "optimize", "progressive", "max_size", "scale")},
+        "recompress": opts.get("recompress_budget") is not None,
+    }, sort_keys=True)
+
+class Manifest:
+    """入力ファイル -> (サイズ, mtime, 内容ハッシュ, 設定, 出力一覧) を保持する SQLite マニフェスト。
+
+    起動時に全件をメモリに読み込み、判定は stat と辞書引きだけで行う。
+    サイズ/mtime が変わっていても内容ハッシュが同じなら（コピー・touch 等）変換済みとみなす。
+    """
+
+    def __init__(self, db_path: Path, settings: str):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.settings = settings
+        self.db = sqlite3.connect(str(db_path))
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                src TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT,
+                settings TEXT, outputs TEXT, updated REAL
+            );
+            CREATE TABLE IF NOT EXISTS produced (path TEXT PRIMARY KEY);
+        """)
+        self.db.commit()
+        self.entries = {
+            row[0]: (row[1], row[2], row[3], row[4], json.loads(row[5]))
+            for row in self.db.execute("SELECT src, size, mtime_ns, digest, settings, outputs FROM entries")
+        }
+        self.produced = {row[0] for row in self.db.execute("SELECT path FROM produced")}
+
+    def outputs(self) -> set[str]:
+        """これまでに書き出した全出力パス（設定変更前のものも含む。入力の走査から除外するため）。"""
+        return self.produced
+
+    def is_current(self, src: Path) -> bool:
+        """前回と同じ設定で変換済みで、入力が未変更かつ出力が揃っていれば True。"""
+        key = str(src.resolve())
+        e = self.entries.get(key)
+        if not e or e[3] != self.settings or not all(os.path.exists(o) for o in e[4]):
+            return False
+        st = src.stat()
+        if (e[0], e[1]) == (st.st_size, st.st_mtime_ns):
+            return True
+        if file_digest(src) != e[2]:
+            return False
+        # 内容は同じなので stat だけ更新して次回からハッシュ計算を省く
+        self.entries[key] = (st.st_size, st.st_mtime_ns, *e[2:])
+        self.db.execute("UPDATE entries SET size=?, mtime_ns=? WHERE src=?", (st.st_size, st.st_mtime_ns, key))
+        self.db.commit()
+        return True
+
+    def record(self, src: Path, digest: str, outputs: list[Path]) -> None:
+        key = str(src.resolve())
+        st = src.stat()
+        outs = [str(p.resolve()) for p in outputs]
+        self.entries[key] = (st.st_size, st.st_mtime_ns, digest, self.settings, outs)
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, st.st_size, st.st_mtime_ns, digest, self.settings, json.dumps(outs), time.time()),
+        )
+        self.db.executemany("INSERT OR IGNORE INTO produced VALUES (?)", [(o,) for o in outs])
+        self.produced.update(outs)
+        self.db.commit()
+
+    def stale(self, root: Path) -> list[tuple[str, list[str]]]:
+        """root 配下で入力が削除されたエントリの (入力, 出力一覧)。"""
+        prefix = str(root.resolve())
+        return [
+            (src, e[4]) for src, e in self.entries.items()
+            if Path(src).is_relative_to(prefix) and not os.path.exists(src)
+        ]
+
+    def forget(self, src: str) -> None:
+        self.entries.pop(src, None)
+        self.db.execute("DELETE FROM entries WHERE src=?", (src,))
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.close()
+
+Task = tuple[Path, list[tuple[Variant, Path]]]
+
+Outcome = tuple[Path, list[Path], str|None, str|None, int]
+
+def convert_chunk(tasks: list[Task], opts: dict, with_digest: bool = False) -> list[Outcome]:
+    """ワーカープロセスで複数ファイルを変換。
+    結果は (src, 書き出したパス, エラー文字列 or None, 内容ハッシュ, 再圧縮の削減バイト数)。
+    with_digest=True なら入力の内容ハッシュも計算する（マニフェスト用）。"""
+    results = []
+    for src, outputs in tasks:
+        try:
+            digest = file_digest(src) if with_digest else None
+            written, saved = convert_one(src, outputs, **opts)
+            results.append((src, written, None, digest, saved))
+        except Exception as e:
+            results.append((src, [], str(e), None, 0))
+    return results
+
+def crashed(src: Path, e: Exception) -> Outcome:
+    return src, [], f"ワーカーが異常終了しました: {e!r}", None, 0
+
+def run_isolated(chunk: list[Task], opts: dict, with_digest: bool) -> list[Outcome]:
+    """1ファイルずつ単独のワーカープロセスで変換する（プロセスが落ちたらそのファイルだけ失敗にして作り直す）。"""
+    results = []
+    ex = None
+    try:
+        for task in chunk:
+            ex = ex or ProcessPoolExecutor(max_workers=1)
+            try:
+                results += ex.submit(convert_chunk, [task], opts, with_digest).result()
+            except BrokenProcessPool as e:
+                ex.shutdown()
+                ex = None
+                results.append(crashed(task[0], e))
+    finally:
+        if ex:
+            ex.shutdown()
+    return results
+
+def run_chunks(chunks: list[list[Task]], opts: dict, jobs: int, with_digest: bool):
+    """チャンクをプロセスプールで変換し、(チャンク番号, 結果) を完了順に返す。
+    同時に渡すチャンクは jobs 個まで（渡したチャンクは実行中のものだけになる）。ワーカーが異常終了すると
+    プール全体が壊れるので、実行中だったチャンクは run_isolated でやり直し、残りは新しいプールで続行する。"""
+    todo = deque(range(len(chunks)))
+    while todo:
+        suspects = []
+        with ProcessPoolExecutor(max_workers=jobs) as ex:
+            running = {}
+            while todo or running:
+                while todo and len(running) < jobs:
+                    i = todo.popleft()
+                    running[ex.submit(convert_chunk, chunks[i], opts, with_digest)] = i
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    i = running.pop(fut)
+                    try:
+                        yield i, fut.result()
+                    except BrokenProcessPool:
+                        suspects.append(i)
+                    except Exception as e:
+                        # 引数の受け渡しに失敗した場合など。チャンク内の全ファイルを失敗扱いにする
+                        yield i, [crashed(src, e) for src, _ in chunks[i]]
+                if suspects:
+                    suspects += running.values()
+                    break
+        for i in sorted(suspects):
+            yield i, run_isolated(chunks[i], opts, with_digest)
+
+def run_tasks(tasks: list[Task], opts: dict, jobs: int, chunksize: int, ordered: bool, with_digest: bool = False):
+    """変換を実行し convert_chunk と同じ形式の結果を順に返す。
+    jobs<=1 ならこのプロセスで逐次実行。"""
+    if jobs <= 1:
+        for task in tasks:
+            yield from convert_chunk([task], opts, with_digest)
+        return
+
+    chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
+    finished = {}
+    next_chunk = 0
+    for i, results in run_chunks(chunks, opts, jobs, with_digest):
+        if not ordered:
+            yield from results
+            continue
+        finished[i] = results
+        while next_chunk in finished:
+            yield from finished.pop(next_chunk)
+            next_chunk += 1
 
 def main():
     parser = argparse.ArgumentParser(
@@ -87,16 +565,54 @@ def main():
     )
     parser.add_argument("input", help="入力ファイルまたはディレクトリのパス")
     parser.add_argument("-o", "--output-dir", help="出力先ディレクトリ")
-    parser.add_argument("--to", default="JPEG", help="出力フォーマット（JPEG/PNG/WebP/TIFF 等）")
-    parser.add_argument("--quality", type=int, default=95, help="JPEG保存時の品質 (1〜100)")
+    parser.add_argument("--to", default="JPEG",
+                        help="出力フォーマット（JPEG/PNG/WebP/AVIF/TIFF 等）。カンマ区切りで複数可、"
+                             ":品質 で形式ごとに指定（例: JPEG:85,WEBP:80,AVIF:60）")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG保存時の品質 (1〜100, --to で品質省略時)")
     parser.add_argument("--bg", nargs=3, type=int, metavar=("R","G","B"),
                         default=(255,255,255), help="透過をJPEGに変換する際の背景色 (既定: 白)")
     parser.add_argument("--no-exif", action="store_true", help="EXIFを保存しない")
     parser.add_argument("--no-optimize", action="store_true", help="JPEG最適化を無効化")
     parser.add_argument("--no-progressive", action="store_true", help="プログレッシブJPEGを無効化")
     parser.add_argument("--dry-run", action="store_true", help="実際には保存せず対象のみ表示")
+    size_group = parser.add_mutually_exclusive_group()
+    size_group.add_argument("--max-size", type=int, default=None,
+                            help="長辺がこのピクセル数を超える画像を縮小（拡大はしない）")
+    size_group.add_argument("--scale", type=float, default=None,
+                            help="縮小倍率（0より大きく1以下, 例: 0.5）")
+    size_group.add_argument("--sizes", default=None,
+                            help="サイズ段（長辺px, カンマ区切り, 例: 320,640,1280,2560）。段ごとに *_converted_{サイズ} を出力")
+    parser.add_argument("--recompress", action="store_true",
+                        help="保存後に PNG/JPEG を可逆に再圧縮して最小のものを残す"
+                             "（JPEG はハフマン最適化/プログレッシブ有無の比較のみ。既定設定では1通り、"
+                             "--no-progressive では試行なしで、削減はほぼ無い）")
+    parser.add_argument("--recompress-budget", type=float, default=2.0,
+                        help="再圧縮の試行時間の上限（入力1画像あたり秒。全形式・全サイズで共有, 既定: 2.0）")
+    parser.add_argument("--manifest", default=None,
+                        help=f"マニフェストのパス（既定: 出力先ディレクトリ、未指定なら入力側に {MANIFEST_NAME}）")
+    parser.add_argument("--no-manifest", action="store_true", help="マニフェストを使わず常に全件変換")
+    parser.add_argument("--force", action="store_true", help="未変更のファイルも再変換（マニフェストは更新）")
+    parser.add_argument("--prune", action="store_true", help="入力が削除された出力（[STALE]）を削除")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="並列プロセス数（既定: 1 = 逐次, 0 = 論理CPU数）")
+    parser.add_argument("--chunksize", type=int, default=0,
+                        help="1回にワーカーへ渡すファイル数（既定: 0 = 件数とプロセス数から自動）")
+    parser.add_argument("--unordered", action="store_true",
+                        help="結果を入力順ではなく完了順に表示（先頭の重いファイルで表示が止まらない）")
 
     args = parser.parse_args()
+    if args.max_size is not None and args.max_size < 1:
+        parser.error("--max-size は 1 以上を指定してください")
+    if args.scale is not None and not 0 < args.scale <= 1:
+        parser.error("--scale は 0 より大きく 1 以下を指定してください")
+    try:
+        formats = parse_formats(args.to, args.quality)
+        sizes = sorted({int(x) for x in args.sizes.split(",") if x.strip()}) if args.sizes else [None]
+    except ValueError as e:
+        parser.error(str(e))
+    if any(s is not None and s < 1 for s in sizes):
+        parser.error("--sizes は 1 以上を指定してください")
+    variants = [Variant(fmt, q, size) for size in sizes for fmt, q in formats]
 
     in_path = Path(args.input)
     out_dir = Path(args.output_dir).resolve() if args.output_dir else None
@@ -112,30 +628,84 @@ def main():
         print("入力が画像ファイル/ディレクトリではありません。", file=sys.stderr)
         sys.exit(2)
 
-    if not targets:
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    opts = dict(
+        background=tuple(args.bg),
+        keep_exif=not args.no_exif, optimize=not args.no_optimize, progressive=not args.no_progressive,
+        max_size=args.max_size, scale=args.scale,
+        # プロセス並列時はプロセス内でさらにスレッドを増やさない
+        threads=1 if jobs > 1 else (os.cpu_count() or 1),
+        recompress_budget=args.recompress_budget if args.recompress else None,
+    )
+
+    manifest = None
+    if not args.no_manifest:
+        state_dir = out_dir or (in_path if in_path.is_dir() else in_path.parent)
+        manifest_path = Path(args.manifest) if args.manifest else state_dir / MANIFEST_NAME
+        # dry-run では新しくマニフェストを作らない
+        if not args.dry_run or manifest_path.exists():
+            manifest = Manifest(manifest_path, settings_key(variants, opts))
+
+    unchanged = 0
+    if manifest:
+        # 前回の出力（*_converted.* 等）は入力として扱わない
+        known = manifest.outputs()
+        targets = [p for p in targets if str(p.resolve()) not in known]
+        if not args.force:
+            todo = [p for p in targets if not manifest.is_current(p)]
+            unchanged = len(targets) - len(todo)
+            targets = todo
+
+        if in_path.is_dir():
+            for src, outs in manifest.stale(in_path):
+                existing = [o for o in outs if os.path.exists(o)]
+                if args.prune and not args.dry_run:
+                    for o in existing:
+                        Path(o).unlink(missing_ok=True)
+                    manifest.forget(src)
+                    print(f"[PRUNE] {src}（入力削除済み）: 出力 {len(existing)} 件を削除")
+                else:
+                    print(f"[STALE] {src}（入力削除済み）: " + (", ".join(existing) or "出力なし"))
+
+    if not targets and not unchanged:
         print("処理対象となる画像が見つかりませんでした。", file=sys.stderr)
         sys.exit(3)
 
-    print(f"[INFO] 対象 {len(targets)} 件 / 出力形式={args.to}")
+    print(f"[INFO] 対象 {len(targets)} 件 / 変更なしでスキップ {unchanged} 件 / 出力形式={args.to} / jobs={jobs}")
+    if args.recompress and any(v.fmt == "JPEG" for v in variants):
+        n = len(jpeg_candidates(dict(optimize=not args.no_optimize, progressive=not args.no_progressive)))
+        print(f"[INFO] JPEG の再圧縮はハフマン最適化/プログレッシブ有無の比較のみです"
+              f"（この設定での試行: {n} 通り{'。削減はありません' if not n else '。削減はわずかです'}）")
 
-    processed = 0
-    for src in targets:
-        dst = plan_output_path(src, out_dir, args.to)
-        if args.dry_run:
-            print(f"DRY-RUN: {src} -> {dst}")
-            continue
+    tasks = [(src, plan_outputs(src, out_dir, variants)) for src in targets]
+    if args.dry_run:
+        for src, outputs in tasks:
+            for _, dst in outputs:
+                print(f"DRY-RUN: {src} -> {dst}")
+        tasks = []
 
-        try:
-            convert_one(
-                src, dst, args.to, args.quality, tuple(args.bg),
-                not args.no_exif, not args.no_optimize, not args.no_progressive
-            )
+    # 1チャンクが小さすぎるとプロセス間通信が、大きすぎると負荷の偏りが目立つので、1プロセスあたり4チャンク程度に
+    chunksize = args.chunksize or max(1, min(32, len(tasks) // (jobs * 4)))
+
+    processed = 0
+    total_saved = 0
+    for src, written, err, digest, saved in run_tasks(tasks, opts, jobs, chunksize, not args.unordered,
+                                                       manifest is not None):
+        if err is None:
             processed += 1
-            print(f"[OK] {src.name} -> {dst.name}")
-        except Exception as e:
-            print(f"[ERR] {src.name}: {e}")
+            total_saved += saved
+            if manifest:
+                manifest.record(src, digest, written)
+            note = f"  (再圧縮 -{human(saved)})" if args.recompress else ""
+            print(f"[OK] {src.name} -> {', '.join(p.name for p in written)}{note}", flush=True)
+        else:
+            print(f"[ERR] {src.name}: {err}", flush=True)
 
+    if manifest:
+        manifest.close()
     print(f"\n[完了] {processed} ファイル変換しました。")
+    if args.recompress:
+        print(f"[INFO] 再圧縮による削減: 合計 {human(total_saved)}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+rembg_server.py
+
+背景透過（rembg）のモデルセッションを常駐させるローカルサーバです。
+- 起動時/初回利用時にロードした u2net / isnet などのセッションを保持し続けるため、
+  remove_bg.py や background_remover.py から1枚だけ処理する場合もモデルロード待ちがありません。
+- localhost の HTTP で待ち受けます（Windows でも動くよう Unix ソケットは使わない）。
+    * GET  /health                          … 稼働確認とロード済みモデル一覧（JSON）
+    * POST /remove?model=u2net&...          … リクエスト本文の画像を処理し PNG を返す
+- クライアント側は submit() を使うか、各CLIの --server オプションを指定します。
+
+使い方:
+    python rembg_server.py --preload u2net isnet-general-use
+    python remove_bg.py images/ --server            # 既定 http://127.0.0.1:7010
+    set REMBG_SERVER=http://127.0.0.1:7010          # 環境変数でも指定可
+"""
+
+import sys
+try:
+    sys.stdout.reconfigure(encoding="utf-8")
+except Exception:
+    pass
+
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7010
+DEFAULT_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+DEFAULT_MODEL = "u2net"
+
+
+def server_url(value: str | None) -> str:
+    """--server の値（空なら環境変数 REMBG_SERVER、それも無ければ既定）を URL に正規化。"""
+    return (value or os.environ.get("REMBG_SERVER") or DEFAULT_URL).rstrip("/")
+
+
+def submit(url: str, data: bytes, model: str | None = None, timeout: float = 300, **opts) -> bytes:
+    """サーバに画像を送り、処理結果の PNG バイト列を返す。失敗時は RuntimeError / OSError。
+
+    opts は alpha_matting, alpha_matting_foreground_threshold, alpha_matting_background_threshold,
+    alpha_matting_erode_size, only_mask, bg。None の項目は送らない。
+    """
+    params = {"model": model or DEFAULT_MODEL}
+    for k, v in opts.items():
+        if v is None:
+            continue
+        params[k] = int(v) if isinstance(v, bool) else v
+    req = urllib.request.Request(
+        f"{url}/remove?{urllib.parse.urlencode(params)}",
+        data=data,
+        method="POST",
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as res:
+            return res.read()
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f"server error {e.code}: {e.read().decode('utf-8', errors='replace')}") from e
+
+
+def is_alive(url: str, timeout: float = 1.0) -> bool:
+    try:
+        with urllib.request.urlopen(f"{url}/health", timeout=timeout) as res:
+            return res.status == 200
+    except OSError:
+        return False
+
+
+class SessionPool:
+    """モデル名 -> セッション。初回要求時にロードし、以後は使い回す。"""
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, model: str):
+        with self.lock:
+            if model not in self.sessions:
+                from rembg import new_session
+                t0 = time.time()
+                self.sessions[model] = new_session(model)
+                print(f"[LOAD] {model} ({(time.time() - t0) * 1000:.0f} ms)", flush=True)
+            return self.sessions[model]
+
+
+def _flag(q: dict, key: str) -> bool:
+    return q.get(key, ["0"])[0].lower() in ("1", "true", "yes")
+
+
+def make_handler(pool: SessionPool, inflight: threading.Semaphore):
+    # 処理本体は CLI と共通（bg_removal はこのモジュールを import するので、循環を避けてここで読み込む）
+    from bg_removal import Options, render
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, code: int, body: bytes, ctype: str) -> None:
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urllib.parse.urlparse(self.path).path != "/health":
+                return self._reply(404, b"not found", "text/plain")
+            body = json.dumps({"ok": True, "models": sorted(pool.sessions)}).encode("utf-8")
+            self._reply(200, body, "application/json")
+
+        def do_POST(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path != "/remove":
+                return self._reply(404, b"not found", "text/plain")
+            q = urllib.parse.parse_qs(url.query)
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not data:
+                return self._reply(400, b"empty body", "text/plain")
+            try:
+                model = q.get("model", [DEFAULT_MODEL])[0]
+                opts = Options(
+                    model=model,
+                    alpha_matting=_flag(q, "alpha_matting"),
+                    am_foreground_thresh=int(q.get("alpha_matting_foreground_threshold", [240])[0]),
+                    am_background_thresh=int(q.get("alpha_matting_background_threshold", [10])[0]),
+                    am_erode=int(q.get("alpha_matting_erode_size", [10])[0]),
+                    only_mask=_flag(q, "only_mask"),
+                    bg=q.get("bg", [None])[0],
+                )
+                session = pool.get(model)
+                with inflight:
+                    out, _, _ = render(data, session, opts)
+            except Exception as e:
+                return self._reply(500, str(e).encode("utf-8"), "text/plain; charset=utf-8")
+            self._reply(200, out, "image/png")
+
+        def log_message(self, fmt, *args):
+            # 1リクエスト1行のアクセスログは騒がしいので出さない
+            pass
+
+    return Handler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="rembg モデル常駐サーバ（localhost HTTP）")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"待ち受けアドレス（既定: {DEFAULT_HOST}）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"待ち受けポート（既定: {DEFAULT_PORT}）")
+    parser.add_argument("--preload", nargs="*", default=[DEFAULT_MODEL],
+                        help=f"起動時にロードするモデル（既定: {DEFAULT_MODEL}）")
+    parser.add_argument("--max-inflight", type=int, default=os.cpu_count() or 1,
+                        help="同時に推論するリクエスト数の上限（既定: 論理CPU数）")
+    args = parser.parse_args()
+
+    pool = SessionPool()
+    for model in args.preload:
+        try:
+            pool.get(model)
+        except Exception as e:
+            print(f"[ERR] モデル初期化に失敗しました: {model}: {e}", file=sys.stderr)
+            return 3
+
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(pool, threading.Semaphore(args.max_inflight)))
+    httpd.daemon_threads = True
+    print(f"[INFO] rembg server: http://{args.host}:{args.port}  models={sorted(pool.sessions)}", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[INFO] 停止しました")
+    finally:
+        httpd.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,11 +4,25 @@
 remove_bg.py
 
 rembg を利用して画像の背景を透過（アルファ）にするユーティリティです。
+処理本体は bg_removal.py にあり、スクリプトからは remove_many() を import して同じ処理を呼べます。
 - 単一ファイルまたはディレクトリを入力に指定可能（ディレクトリは再帰的に処理）
 - 出力は PNG（透過対応）。既定では入力と同じ場所に *_nobg.png を作成
+  --format webp で WebP ロスレス、--format raw で RGBA（--only-mask 時はマスク）の .npy を出力。
+  PNG の zlib レベルは --png-level（既定 1 = 高速。小さい画像の大量処理で圧縮が律速しないように）
+- 出力は出力先と同じディレクトリの一時ファイルに書いてからリネームする（途中で落ちても壊れた出力を残さない）
+- --timing で画像ごとの工程別時間（読込/デコード/推論/合成/エンコード/書込）と合計を表示
 - --output-dir で一括出力先を指定可能
 - モデル指定（--model）や、画質優先のアルファマッティング（--alpha-matting）有効化に対応
 - 既に出力が存在する場合はスキップ（--force で上書き）
+- --workers N で N 本のワーカーを並列実行（ワーカーごとにモデルセッションを1つ保持し、
+  読込・デコード・推論・PNGエンコード・書込を画像単位で重ねて処理）
+- --server で常駐サーバ（rembg_server.py）に処理を依頼し、モデルロード待ちを省略
+  （サーバに接続できない場合はこのプロセス内で処理）
+- 推論したマスクを (画像内容ハッシュ, モデル) ごとにディスクへキャッシュ（PNG圧縮, LRUで容量上限つき）。
+  --bg / --only-mask / --alpha-matting / --am-* を変えて --force で再実行しても推論は走らず、合成だけやり直す
+- --proxy-size N で長辺 N px の縮小画像で推論し、マスクを拡大したうえで境界付近のタイルだけ
+  原寸でエッジ追従の補正（ガイデッドフィルタ / --alpha-matting 時はタイル単位のマッティング）を行う。
+  高解像度画像でも原寸の重い処理は境界帯に限られ、作業メモリはタイルサイズで頭打ちになる
 
 注意:
 - Windows（Git Bash / PowerShell）での利用を想定。出力メッセージは日本語。
@@ -26,66 +40,14 @@ except Exception:
     pass
 
 import argparse
+import os
 from pathlib import Path
-import shutil
-import tempfile
 
-from rembg import remove, new_session
-
-# 対応拡張子
-IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff", ".bmp"}
-
-
-def is_image(p: Path) -> bool:
-    return p.is_file() and p.suffix.lower() in IMAGE_EXTS
-
-
-def iter_images(root: Path):
-    if root.is_file():
-        if is_image(root):
-            yield root
-    else:
-        for p in sorted(root.rglob("*")):
-            if is_image(p):
-                yield p
-
-
-def plan_output_path(inp: Path, out_dir: Path | None) -> Path:
-    if out_dir:
-        out_dir.mkdir(parents=True, exist_ok=True)
-        return out_dir / (inp.stem + "_nobg.png")
-    return inp.with_stem(inp.stem + "_nobg").with_suffix(".png")
-
-
-def process_one(src: Path, dst: Path, session, args) -> tuple[bool, str]:
-    if dst.exists() and not args.force:
-        return False, f"[SKIP] 既に存在: {dst}"
-
-    with open(src, "rb") as f:
-        data = f.read()
-
-    out_bytes = remove(
-        data,
-        session=session,
-        alpha_matting=args.alpha_matting,
-        alpha_matting_foreground_threshold=args.am_foreground_thresh,
-        alpha_matting_background_threshold=args.am_background_thresh,
-        alpha_matting_erode_size=args.am_erode,
-        only_mask=args.only_mask,
-        bg=args.bg,
-    )
-
-    tmpdir = Path(tempfile.mkdtemp(prefix="rbg_"))
-    try:
-        tmp_out = tmpdir / (dst.name + ".part")
-        with open(tmp_out, "wb") as o:
-            o.write(out_bytes)
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        shutil.move(str(tmp_out), str(dst))
-    finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
-
-    return True, f"[OK] {src.name} -> {dst.name}"
+from bg_removal import (
+    DEFAULT_MASK_CACHE, IMAGE_EXTS, OUTPUT_EXTS, MaskCache, StageTimes,
+    iter_images, parse_color, plan_output_path, remove_many, session_pool,
+)
+from rembg_server import is_alive, server_url
 
 
 def main() -> int:
@@ -108,12 +70,35 @@ def main() -> int:
                         help="マスク画像のみを出力（デバッグ/特殊用途）")
     parser.add_argument("--bg", default=None,
                         help="透明ではなく単色背景で出力したい場合のRGBA色（例: #ffffffff ＝ 白不透明）")
+    parser.add_argument("--format", choices=list(OUTPUT_EXTS), default="png",
+                        help="出力形式: png / webp（ロスレス） / raw（RGBA の .npy）（既定: png）")
+    parser.add_argument("--png-level", type=int, choices=range(10), default=1, metavar="0-9",
+                        help="PNG の zlib 圧縮レベル（既定: 1 = 高速。9 で最小サイズ）")
+    parser.add_argument("--timing", action="store_true",
+                        help="画像ごとの工程別時間と合計を表示")
+    parser.add_argument("--proxy-size", type=int, default=0,
+                        help="長辺がこれより大きい画像は縮小して推論し、境界付近だけ原寸で補正（例: 1024, 既定: 0 = 無効）")
+    parser.add_argument("--mask-cache", default=str(DEFAULT_MASK_CACHE),
+                        help=f"推論マスクのキャッシュ先（既定: {DEFAULT_MASK_CACHE}）")
+    parser.add_argument("--mask-cache-mb", type=int, default=1024,
+                        help="マスクキャッシュの容量上限MB（超えたら古いものから削除, 既定: 1024）")
+    parser.add_argument("--no-mask-cache", action="store_true",
+                        help="マスクキャッシュを使わず毎回推論する")
     parser.add_argument("--force", action="store_true",
                         help="出力が既に存在しても上書き")
     parser.add_argument("--dry-run", action="store_true",
                         help="実際には処理せず、対象と出力先だけ表示")
+    parser.add_argument("--server", nargs="?", const="", default=None,
+                        help="常駐サーバ（rembg_server.py）に処理を依頼。URL省略時は REMBG_SERVER か http://127.0.0.1:7010")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="並列ワーカー数（ワーカーごとにモデルを1つロード, 既定: 1）")
 
     args = parser.parse_args()
+    if args.bg:
+        try:
+            parse_color(args.bg)
+        except ValueError as e:
+            parser.error(str(e))
     inp = Path(args.input)
     out_dir = Path(args.output_dir).resolve() if args.output_dir else None
 
@@ -121,8 +106,23 @@ def main() -> int:
         print(f"[ERR] 入力が存在しません: {inp}", file=sys.stderr)
         return 2
 
+    workers = max(1, args.workers)
+    if workers > 1:
+        # セッションごとの推論スレッド数をコア数/ワーカー数に抑えて過剰なスレッド競合を防ぐ
+        # （rembg は OMP_NUM_THREADS を onnxruntime のスレッド数に反映する）
+        os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
+
+    server = None
+    if args.server is not None:
+        server = server_url(args.server)
+        if not is_alive(server):
+            print(f"[WARN] サーバに接続できません: {server}（このプロセス内で処理します）", file=sys.stderr)
+            server = None
+
     try:
-        session = new_session(args.model) if args.model else new_session()
+        # 先にモデルをロードして初期化失敗をここで報告する（サーバ利用時はロードしない）
+        if not server:
+            session_pool(args.model, workers)
     except Exception as e:
         print("[ERR] モデル初期化に失敗しました:", e, file=sys.stderr)
         return 3
@@ -134,21 +134,29 @@ def main() -> int:
         return 0
 
     print(f"[INFO] 対象 {len(targets)} 件 / model={args.model or 'default'}"
-          f" / alpha_matting={args.alpha_matting}")
+          f" / alpha_matting={args.alpha_matting} / workers={workers}")
 
-    done = 0
-    for src in targets:
-        dst = plan_output_path(src, out_dir)
-        if args.dry_run:
+    ext = OUTPUT_EXTS[args.format]
+    tasks = [(src, plan_output_path(src, out_dir, ext)) for src in targets]
+    if args.dry_run:
+        for src, dst in tasks:
             print(f"DRY-RUN: {src} -> {dst}")
-            continue
+        tasks = []
 
-        ok, msg = process_one(src, dst, session, args)
-        print(msg)
-        if ok:
+    done = 0
+    masks = None
+    if tasks and not server and not args.no_mask_cache:
+        masks = MaskCache(Path(args.mask_cache), args.mask_cache_mb * 1024 * 1024)
+
+    times = StageTimes() if args.timing else None
+    for r in remove_many(tasks, args, workers=workers, server=server, masks=masks, times=times):
+        print(r.message())
+        if r.ok:
             done += 1
 
     print(f"[DONE] {done}/{len(targets)} 件 完了")
+    if times and done:
+        print(f"[TIME] {times.summary()}")
     return 0
 
 
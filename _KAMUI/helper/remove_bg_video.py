@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+remove_bg_video.py
+
+rembg を利用して動画の背景を透過（アルファ付き動画）にするユーティリティです。
+- ffmpeg でデコードしたフレームをパイプ（rawvideo）で受け取り、処理結果もパイプでエンコーダに渡す。
+  中間 PNG は一切作らない
+- モデル推論はキーフレーム（--keyframe-interval ごと）とシーンチェンジ時だけ行い、
+  その間のフレームは前フレームのマスクをオプティカルフロー（OpenCV Farneback）で移し、
+  境界付近だけ原寸で補正する（remove_bg.py の --proxy-size と同じ補正処理）
+- 出力は ProRes 4444（.mov, yuva444p10le）または WebM VP9 アルファ（.webm, yuva420p）。
+  音声は元動画からそのまま（.mov は PCM, .webm は Opus で）付け直す（--no-audio で省略）
+- 既定では入力と同じ場所に *_nobg.mov / *_nobg.webm を作成。既に存在する場合はスキップ（--force で上書き）
+
+注意:
+- ffmpeg（ffmpeg-python）と OpenCV（rembg の依存で入る opencv-python-headless）が必要です。
+- 可変フレームレートの動画は入力の r_frame_rate で固定フレームレートとして書き出します。
+"""
+
+import sys
+# 日本語出力の文字化け対策（Python 3.7+）
+try:
+    sys.stdout.reconfigure(encoding="utf-8")
+except Exception:
+    pass
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+import cv2
+import ffmpeg
+import numpy as np
+from PIL import Image
+
+from bg_removal import refine_upscaled_mask, session_pool, to_proxy
+
+VIDEO_EXTS = {".mp4", ".mov", ".mkv", ".avi", ".webm", ".m4v"}
+
+# 出力形式 -> (拡張子, ffmpeg 出力オプション, 音声コーデック)
+FORMATS = {
+    "prores": (".mov", {"f": "mov", "vcodec": "prores_ks", "profile:v": "4444",
+                        "pix_fmt": "yuva444p10le"}, "pcm_s16le"),
+    # libvpx でアルファを保つには auto-alt-ref を切る
+    "webm": (".webm", {"f": "webm", "vcodec": "libvpx-vp9", "pix_fmt": "yuva420p",
+                       "crf": 30, "b:v": 0, "auto-alt-ref": 0}, "libopus"),
+}
+
+# フロー計算とシーンチェンジ判定に使う縮小フレームの長辺（px）
+FLOW_SIDE = 480
+PROGRESS_INTERVAL = 2.0
+
+
+def probe_stream(p: Path) -> dict:
+    """映像の幅・高さ（回転適用後）・フレームレート・総フレーム数・音声有無を返す。失敗時は例外送出。"""
+    meta = ffmpeg.probe(str(p))
+    streams = meta.get("streams", [])
+    v = next((st for st in streams if st.get("codec_type") == "video"), None)
+    if v is None:
+        raise ValueError("映像ストリームがありません")
+    w, h = int(v["width"]), int(v["height"])
+    # ffmpeg はデコード時に回転メタデータを適用するので、縦向き動画は幅と高さを入れ替える
+    rotate = int(v.get("tags", {}).get("rotate", 0))
+    for sd in v.get("side_data_list", []):
+        rotate = int(sd.get("rotation", rotate))
+    if abs(rotate) % 180 == 90:
+        w, h = h, w
+    rate = v.get("r_frame_rate") or v.get("avg_frame_rate") or "30/1"
+    num, _, den = rate.partition("/")
+    fps = float(num) / float(den or 1) if float(den or 1) else 30.0
+    frames = int(v.get("nb_frames") or 0)
+    if not frames:
+        frames = int(float(meta.get("format", {}).get("duration") or 0) * fps)
+    return {
+        "width": w,
+        "height": h,
+        "rate": rate,
+        "fps": fps,
+        "frames": frames,
+        "audio": any(st.get("codec_type") == "audio" for st in streams),
+    }
+
+
+def open_reader(src: Path):
+    return (
+        ffmpeg
+        .input(str(src))
+        .output("pipe:", format="rawvideo", pix_fmt="rgb24")
+        .global_args("-hide_banner", "-nostdin", "-loglevel", "error")
+        .run_async(pipe_stdout=True)
+    )
+
+
+def open_writer(src: Path, out_path: Path, info: dict, fmt: str, audio: bool):
+    _, vopts, acodec = FORMATS[fmt]
+    video = ffmpeg.input("pipe:", format="rawvideo", pix_fmt="rgba",
+                         s=f"{info['width']}x{info['height']}", framerate=info["rate"])
+    streams = [video]
+    opts = dict(vopts)
+    if audio:
+        streams.append(ffmpeg.input(str(src)).audio)
+        opts["acodec"] = acodec
+    return (
+        ffmpeg
+        .output(*streams, str(out_path), **opts)
+        .global_args("-hide_banner", "-loglevel", "error")
+        .overwrite_output()
+        .run_async(pipe_stdin=True)
+    )
+
+
+def warp_mask(prev_mask: np.ndarray, prev_gray: np.ndarray, gray: np.ndarray) -> np.ndarray:
+    """前フレームのマスクを現フレームへ移す（現→前のフローで逆方向にサンプリング）。"""
+    flow = cv2.calcOpticalFlowFarneback(gray, prev_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+    h, w = gray.shape
+    gx, gy = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+    return cv2.remap(prev_mask, gx + flow[..., 0], gy + flow[..., 1],
+                     interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def process_video(src: Path, dst: Path, session, args) -> tuple[bool, str]:
+    if dst.exists() and not args.force:
+        return False, f"[SKIP] 既に存在: {dst}"
+
+    info = probe_stream(src)
+    w, h = info["width"], info["height"]
+    frame_bytes = w * h * 3
+    # 書込途中で落ちても壊れた出力を残さないよう、同じディレクトリの一時ファイルに書いてから置き換える
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.part")
+    dst.parent.mkdir(parents=True, exist_ok=True)
+
+    reader = open_reader(src)
+    writer = open_writer(src, tmp, info, args.format, info["audio"] and not args.no_audio)
+    n = inferred = 0
+    since = args.keyframe_interval
+    prev_gray = prev_mask = None
+    t0 = last = time.time()
+    try:
+        while True:
+            buf = reader.stdout.read(frame_bytes)
+            if len(buf) < frame_bytes:
+                break
+            img = Image.frombuffer("RGB", (w, h), buf, "raw", "RGB", 0, 1)
+            small = to_proxy(img, FLOW_SIDE) if max(w, h) > FLOW_SIDE else img
+            gray = np.asarray(small.convert("L"))
+
+            scene_cut = (prev_gray is not None
+                         and np.abs(gray.astype(np.int16) - prev_gray).mean() / 255 > args.scene_thresh)
+            if prev_gray is None or since >= args.keyframe_interval or scene_cut:
+                mask = session.predict(img)[0]
+                inferred += 1
+                since = 0
+            else:
+                warped = warp_mask(prev_mask, prev_gray, gray)
+                mask = refine_upscaled_mask(img, Image.fromarray(warped), args)
+            since += 1
+            # 次フレームへは補正後のマスクを縮小して渡す（フローの誤差が積み重ならないように）
+            prev_gray = gray
+            prev_mask = np.asarray(mask.resize(small.size, Image.Resampling.BILINEAR))
+
+            out = img.convert("RGBA")
+            out.putalpha(mask)
+            writer.stdin.write(out.tobytes())
+            n += 1
+
+            now = time.time()
+            if now - last >= PROGRESS_INTERVAL:
+                last = now
+                total = f"/{info['frames']}" if info["frames"] else ""
+                print(f"  {src.name}: {n}{total} frames  推論 {inferred}  {n / (now - t0):.1f} fps", flush=True)
+    except BaseException:
+        reader.kill()
+        writer.kill()
+        reader.wait()
+        writer.wait()
+        tmp.unlink(missing_ok=True)
+        raise
+
+    reader.stdout.close()
+    writer.stdin.close()
+    reader.wait()
+    writer.wait()
+    if reader.returncode != 0 or writer.returncode != 0 or n == 0:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"ffmpeg が失敗しました（decode={reader.returncode}, encode={writer.returncode}, frames={n}）")
+    os.replace(tmp, dst)
+
+    sec = time.time() - t0
+    return True, (f"[OK] {src.name} -> {dst.name}  {n} frames / 推論 {inferred} 回"
+                  f"（{n / sec:.1f} fps, {sec:.1f}s）")
+
+
+def iter_videos(inputs: list[str]):
+    for s in inputs:
+        p = Path(s)
+        if p.is_dir():
+            yield from sorted(q for q in p.rglob("*") if q.is_file() and q.suffix.lower() in VIDEO_EXTS)
+        elif p.is_file():
+            yield p
+        else:
+            print(f"[WARN] 入力が存在しません: {p}", file=sys.stderr)
+
+
+def plan_output_path(inp: Path, out_dir: Path | None, ext: str) -> Path:
+    if out_dir:
+        return out_dir / (inp.stem + "_nobg" + ext)
+    return inp.with_name(inp.stem + "_nobg" + ext)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="動画の背景透過ツール（rembgベース, キーフレーム推論 + オプティカルフロー伝播）"
+    )
+    parser.add_argument("inputs", nargs="+", help="入力動画 or ディレクトリ（複数可）")
+    parser.add_argument("-o", "--output-dir", help="出力先ディレクトリ（未指定なら同階層に *_nobg.*）")
+    parser.add_argument("--format", choices=list(FORMATS), default="prores",
+                        help="出力形式: prores（ProRes 4444 .mov） / webm（VP9 アルファ .webm）（既定: prores）")
+    parser.add_argument("--model", default=None,
+                        help="使用モデル（例: u2net, isnet-general-use など。未指定は既定）")
+    parser.add_argument("--keyframe-interval", type=int, default=12,
+                        help="モデル推論を行う間隔（フレーム数, 既定: 12。1 で全フレーム推論）")
+    parser.add_argument("--scene-thresh", type=float, default=0.12,
+                        help="前フレームとの平均輝度差（0-1）がこれを超えたらシーンチェンジとみなして推論（既定: 0.12）")
+    parser.add_argument("--alpha-matting", action="store_true",
+                        help="伝播フレームの境界補正をアルファマッティングで行う（遅いが高品質）")
+    parser.add_argument("--am-foreground-thresh", type=int, default=240,
+                        help="アルファマッティング前景しきい値（既定: 240）")
+    parser.add_argument("--am-background-thresh", type=int, default=10,
+                        help="アルファマッティング背景しきい値（既定: 10）")
+    parser.add_argument("--am-erode", type=int, default=10,
+                        help="アルファマッティングの収縮サイズ（既定: 10）")
+    parser.add_argument("--no-audio", action="store_true", help="音声を付けない")
+    parser.add_argument("--force", action="store_true", help="出力が既に存在しても上書き")
+    parser.add_argument("--dry-run", action="store_true", help="実際には処理せず、対象と出力先だけ表示")
+
+    args = parser.parse_args()
+    if args.keyframe_interval < 1:
+        parser.error("--keyframe-interval は 1 以上を指定してください")
+    out_dir = Path(args.output_dir).resolve() if args.output_dir else None
+    ext = FORMATS[args.format][0]
+
+    tasks = [(src, plan_output_path(src, out_dir, ext)) for src in iter_videos(args.inputs)]
+    if not tasks:
+        print("[WARN] 対象動画が見つかりませんでした。対応拡張子:", ", ".join(sorted(VIDEO_EXTS)))
+        return 0
+    if args.dry_run:
+        for src, dst in tasks:
+            print(f"DRY-RUN: {src} -> {dst}")
+        return 0
+
+    try:
+        session = session_pool(args.model).get()
+    except Exception as e:
+        print("[ERR] モデル初期化に失敗しました:", e, file=sys.stderr)
+        return 3
+
+    print(f"[INFO] 対象 {len(tasks)} 件 / model={args.model or 'default'} / format={args.format}"
+          f" / keyframe_interval={args.keyframe_interval}")
+    done = 0
+    for src, dst in tasks:
+        try:
+            ok, msg = process_video(src, dst, session, args)
+        except Exception as e:
+            ok, msg = False, f"[ERR] {src.name}: {e}"
+        print(msg)
+        if ok:
+            done += 1
+
+    print(f"[DONE] {done}/{len(tasks)} 件 完了")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
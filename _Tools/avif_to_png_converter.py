@@ -1,22 +1,66 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from tkinterdnd2 import DND_FILES, TkinterDnD
-from PIL import Image
 import os
+import queue
 import threading
-from pathlib import Path
+import time
+
+# 変換本体は Tk に依存しないエンジン側（CLI / Python からも同じものを使う）
+from avif_to_png_engine import DEFAULT_PROFILE, PROFILE_LABELS, PROFILES, ConversionEngine, scan_avif
+
+# 進捗表示の更新間隔（ミリ秒）。ファイル数に関係なく画面更新はこの間隔で1回だけ
+POLL_MS = 100
+
+
+class FileFeed:
+    """変換対象のファイル一覧。フォルダ走査中も追加でき、読み出し側は走査の完了を待たずに先頭から順に取り出せる"""
+
+    def __init__(self, files=(), closed=False):
+        self.items = list(files)
+        self.closed = closed
+        self.cond = threading.Condition()
+
+    def add(self, path):
+        with self.cond:
+            self.items.append(path)
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        i = 0
+        while True:
+            with self.cond:
+                while i >= len(self.items) and not self.closed:
+                    self.cond.wait()
+                if i >= len(self.items):
+                    return
+                item = self.items[i]
+            i += 1
+            yield item
 
 
 class AvifToPngConverter:
     def __init__(self, root):
         self.root = root
         self.root.title("AVIF to PNG 変換ツール")
-        self.root.geometry("600x500")
+        self.root.geometry("600x560")
         self.root.resizable(False, False)
 
-        self.files = []
+        self.files = FileFeed(closed=True)
+        self.scan_stop = None
         self.converting = False
-        self.cancel_flag = False
+        # 並列数（既定: CPUコア数）とPNGプロファイルは変換開始時にエンジンへ渡す
+        self.engine = ConversionEngine()
+        # 変換スレッド → UI への結果の受け渡し（UI 側が POLL_MS ごとにまとめて取り出す）
+        self.events = queue.Queue()
 
         self.setup_ui()
 
@@ -49,7 +93,7 @@ class AvifToPngConverter:
 
         info_label = tk.Label(
             drop_frame,
-            text="AVIFファイルをドラッグ&ドロップ\nまたは下のボタンから選択してください",
+            text="AVIFファイル / フォルダをドラッグ&ドロップ\nまたは下のボタンから選択してください",
             font=("Arial", 10)
         )
         info_label.pack(pady=(0, 10))
@@ -76,6 +120,20 @@ class AvifToPngConverter:
         )
         self.file_info_label.pack(pady=(10, 0))
 
+        # PNG保存プロファイル
+        profile_frame = tk.Frame(main_frame)
+        profile_frame.pack(fill=tk.X, pady=(0, 10))
+        tk.Label(profile_frame, text="PNG圧縮:", font=("Arial", 10)).pack(side=tk.LEFT)
+        self.profile_var = tk.StringVar(value=DEFAULT_PROFILE)
+        for name in PROFILES:
+            tk.Radiobutton(
+                profile_frame,
+                text=PROFILE_LABELS[name],
+                variable=self.profile_var,
+                value=name,
+                font=("Arial", 10)
+            ).pack(side=tk.LEFT, padx=(10, 0))
+
         # 進捗バー
         progress_frame = tk.Frame(main_frame)
         progress_frame.pack(fill=tk.X, pady=(0, 10))
@@ -161,148 +219,191 @@ class AvifToPngConverter:
         )
 
         if files:
-            self.files = list(files)
-            self.file_info_label.config(
-                text=f"選択されたファイル: {len(self.files)}個"
-            )
-            self.convert_button.config(state=tk.NORMAL)
-            self.reset_button.config(state=tk.NORMAL)
+            self.stop_scan()
+            self.files = FileFeed(files, closed=True)
+            self.update_file_count()
             self.status_label.config(text="")
 
     def drop_files(self, event):
-        """ドラッグ&ドロップされたファイルを処理"""
+        """ドラッグ&ドロップされたファイル/フォルダを処理"""
         if self.converting:
             return
 
         # ドロップされたファイルのパスを取得
-        files = self.root.tk.splitlist(event.data)
+        paths = self.root.tk.splitlist(event.data)
 
-        # AVIFファイルのみをフィルタリング
-        avif_files = [f for f in files if f.lower().endswith('.avif')]
+        # フォルダは配下を別スレッドで走査、ファイルはAVIFのみをフィルタリング
+        folders = [p for p in paths if os.path.isdir(p)]
+        avif_files = [p for p in paths if p.lower().endswith('.avif') and not os.path.isdir(p)]
 
-        if avif_files:
-            self.files = avif_files
-            self.file_info_label.config(
-                text=f"選択されたファイル: {len(self.files)}個"
+        if not folders and not avif_files:
+            messagebox.showwarning(
+                "警告",
+                "AVIFファイルが含まれていません"
             )
-            self.convert_button.config(state=tk.NORMAL)
-            self.reset_button.config(state=tk.NORMAL)
-            self.status_label.config(text="")
-        else:
+            return
+
+        self.stop_scan()
+        self.files = FileFeed(avif_files, closed=not folders)
+        if folders:
+            # 数万ファイルのフォルダでも待たされないよう、見つかった分から変換を始められる
+            self.scan_stop = threading.Event()
+            thread = threading.Thread(target=self.scan_folders, args=(folders, self.files, self.scan_stop))
+            thread.daemon = True
+            thread.start()
+            self.root.after(POLL_MS, self.poll_scan, self.files)
+        self.update_file_count()
+        self.status_label.config(text="")
+
+    def scan_folders(self, folders, feed, stop):
+        """走査スレッド。見つかったAVIFを feed に追加するだけで、Tk には一切触らない"""
+        try:
+            for folder in folders:
+                for path in scan_avif(folder):
+                    if stop.is_set():
+                        return
+                    feed.add(str(path))
+        finally:
+            feed.close()
+
+    def stop_scan(self):
+        if self.scan_stop:
+            self.scan_stop.set()
+            self.scan_stop = None
+
+    def poll_scan(self, feed):
+        """走査中は POLL_MS ごとに見つかったファイル数を表示に反映する"""
+        if feed is not self.files:
+            return  # リセット/再選択された
+        self.update_file_count()
+        if not feed.closed:
+            self.root.after(POLL_MS, self.poll_scan, feed)
+        elif not feed and not self.converting:
             messagebox.showwarning(
                 "警告",
                 "AVIFファイルが含まれていません"
             )
 
+    def update_file_count(self):
+        scanning = "（フォルダを検索中…）" if not self.files.closed else ""
+        self.file_info_label.config(text=f"選択されたファイル: {len(self.files)}個{scanning}")
+        if not self.converting:
+            self.convert_button.config(state=tk.NORMAL if self.files else tk.DISABLED)
+            self.reset_button.config(state=tk.NORMAL)
+
     def start_conversion(self):
         if not self.files or self.converting:
             return
 
         self.converting = True
-        self.cancel_flag = False
+        # ワーカースレッドから Tk 変数を読まないよう、開始時に確定させる
+        self.engine.profile = self.profile_var.get()
         self.convert_button.config(state=tk.DISABLED)
         self.cancel_button.config(state=tk.NORMAL)
         self.reset_button.config(state=tk.DISABLED)
 
+        # 集計は UI スレッドだけが触る（総数はフォルダ走査中なら増えていく）
+        self.done_files = 0
+        self.output_bytes = 0
+        self.success_files = []
+        self.failed_files = []
+        self.started = time.perf_counter()
+        self.update_status(f"変換中: {len(self.files)}個のファイル（{self.engine.workers}並列）")
+
         # 別スレッドで変換処理を実行
         thread = threading.Thread(target=self.convert_files)
         thread.daemon = True
         thread.start()
+        self.root.after(POLL_MS, self.poll_progress)
 
     def convert_files(self):
-        success_files = []
-        failed_files = []
-        total_files = len(self.files)
-
-        # 1回目の変換
-        for i, file_path in enumerate(self.files):
-            if self.cancel_flag:
-                self.update_status("キャンセルされました")
-                self.finish_conversion()
-                return
-
-            file_name = os.path.basename(file_path)
-            self.update_status(f"変換中: {file_name} ({i + 1}/{total_files})")
-
+        """変換スレッド。結果をキューに積むだけで、Tk には一切触らない"""
+        try:
+            # 結果は完了順に届く。失敗したファイルはエンジン内で1回だけ再トライ済み
+            for result in self.engine.run(self.files):
+                self.events.put(result)
+        finally:
+            self.events.put(None)  # 終了の合図
+
+    def poll_progress(self):
+        """POLL_MS ごとにキューを空にして、溜まった結果をまとめて1回の画面更新に反映する"""
+        finished = False
+        last = None
+        while True:
             try:
-                output_path = self.convert_avif_to_png(file_path)
-                success_files.append(output_path)
-            except Exception as e:
-                failed_files.append((file_path, str(e)))
-
-            progress = int(((i + 1) / total_files) * 100)
-            self.update_progress(progress)
-
-        # 失敗したファイルの再トライ
-        if failed_files and not self.cancel_flag:
-            self.update_status(f"再トライ中: {len(failed_files)}個のファイル")
-
-            retry_failed = []
-            for i, (file_path, error) in enumerate(failed_files):
-                if self.cancel_flag:
-                    self.update_status("キャンセルされました")
-                    self.finish_conversion()
-                    return
-
-                file_name = os.path.basename(file_path)
-                self.update_status(f"再トライ中: {file_name} ({i + 1}/{len(failed_files)})")
+                result = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if result is None:
+                finished = True
+                break
+            last = result
+            self.done_files += 1
+            if result.ok:
+                self.success_files.append(str(result.dst))
+                self.output_bytes += result.size
+            else:
+                self.failed_files.append(f"{result.src.name}: {result.error}")
+
+        if last is not None:
+            self.show_progress(last)
+
+        if finished:
+            self.conversion_finished()
+        else:
+            self.root.after(POLL_MS, self.poll_progress)
 
-                try:
-                    output_path = self.convert_avif_to_png(file_path)
-                    success_files.append(output_path)
-                except Exception as e:
-                    retry_failed.append(f"{file_name}: {str(e)}")
+    def show_progress(self, last):
+        elapsed = max(time.perf_counter() - self.started, 1e-6)
+        files_per_sec = self.done_files / elapsed
+        mb_per_sec = self.output_bytes / 1024 / 1024 / elapsed
+        total_files = len(self.files)
+        if self.files.closed:
+            eta = "残り約 " + format_eta((total_files - self.done_files) / files_per_sec)
+        else:
+            eta = "フォルダを検索中"  # 総数が未確定なので残り時間は出さない
+        label = "再トライ済み" if last.attempts > 1 else "変換済み"
+        detail = "失敗" if not last.ok else f"{last.seconds * 1000:.0f} ms, {last.size / 1024:,.0f} KB"
+        self.update_progress(int(self.done_files / total_files * 100))
+        self.update_status(
+            f"{label}: {last.src.name} {detail} ({self.done_files}/{total_files})\n"
+            f"{files_per_sec:.1f} files/s, {mb_per_sec:.1f} MB/s, {eta}"
+        )
 
-            if retry_failed:
-                error_msg = "変換に失敗したファイル:\n" + "\n".join(retry_failed)
-                self.root.after(0, lambda: messagebox.showerror("エラー", error_msg))
+    def conversion_finished(self):
+        if self.engine.cancelled:
+            self.update_status("キャンセルされました")
+        else:
+            if self.failed_files:
+                messagebox.showerror("エラー", "変換に失敗したファイル:\n" + "\n".join(self.failed_files))
 
-        if not self.cancel_flag:
+            elapsed = time.perf_counter() - self.started
             self.update_progress(100)
-            self.update_status(f"完了: {len(success_files)}個のファイルを変換しました")
+            self.update_status(
+                f"完了: {len(self.success_files)}個のファイルを変換しました"
+                f"（{elapsed:.1f}秒, {self.done_files / elapsed if elapsed else 0:.1f} files/s）"
+            )
 
-            if success_files:
-                output_dir = os.path.dirname(success_files[0])
-                self.root.after(0, lambda: messagebox.showinfo(
+            if self.success_files:
+                output_dir = os.path.dirname(self.success_files[0])
+                messagebox.showinfo(
                     "完了",
-                    f"{len(success_files)}個のファイルを変換しました。\n\n保存先: {output_dir}"
-                ))
+                    f"{len(self.success_files)}個のファイルを変換しました。\n\n保存先: {output_dir}"
+                )
 
         self.finish_conversion()
 
-    def convert_avif_to_png(self, input_path):
-        """AVIFファイルをPNGに変換"""
-        # 入力ファイルのパス情報を取得
-        input_file = Path(input_path)
-        input_dir = input_file.parent
-
-        # convertディレクトリを作成
-        convert_dir = input_dir / "convert"
-        convert_dir.mkdir(exist_ok=True)
-
-        # 出力ファイル名を生成（convertディレクトリ内）
-        output_path = convert_dir / input_file.with_suffix('.png').name
-
-        # 画像を開いて変換
-        with Image.open(input_path) as img:
-            # RGBAモードに変換（透過対応）
-            if img.mode != 'RGBA':
-                img = img.convert('RGBA')
-
-            # PNGとして保存
-            img.save(output_path, 'PNG', optimize=True)
-
-        return str(output_path)
-
     def cancel_conversion(self):
-        self.cancel_flag = True
         self.cancel_button.config(state=tk.DISABLED)
+        # 待ち行列のファイルをすぐに取り消す（変換中のファイルは裏で完了させる）
+        self.engine.cancel()
 
     def reset(self):
         if self.converting:
             return
 
-        self.files = []
+        self.stop_scan()
+        self.files = FileFeed(closed=True)
         self.file_info_label.config(text="選択されたファイル: 0個")
         self.progress_bar['value'] = 0
         self.progress_label.config(text="進捗: 0%")
@@ -310,18 +411,27 @@ class AvifToPngConverter:
         self.convert_button.config(state=tk.DISABLED)
         self.reset_button.config(state=tk.DISABLED)
 
+    # 以下は UI スレッド（poll_progress / ボタン操作）からのみ呼ぶ
     def update_progress(self, value):
-        self.root.after(0, lambda: self.progress_bar.config(value=value))
-        self.root.after(0, lambda: self.progress_label.config(text=f"進捗: {value}%"))
+        self.progress_bar.config(value=value)
+        self.progress_label.config(text=f"進捗: {value}%")
 
     def update_status(self, message):
-        self.root.after(0, lambda: self.status_label.config(text=message))
+        self.status_label.config(text=message)
 
     def finish_conversion(self):
         self.converting = False
-        self.root.after(0, lambda: self.convert_button.config(state=tk.NORMAL if self.files else tk.DISABLED))
-        self.root.after(0, lambda: self.cancel_button.config(state=tk.DISABLED))
-        self.root.after(0, lambda: self.reset_button.config(state=tk.NORMAL if self.files else tk.DISABLED))
+        self.convert_button.config(state=tk.NORMAL if self.files else tk.DISABLED)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.reset_button.config(state=tk.NORMAL if self.files else tk.DISABLED)
+
+
+def format_eta(seconds):
+    """残り時間を 1:05 / 1:02:03 の形で表示"""
+    seconds = int(seconds + 0.5)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}"
 
 
 def main():
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+avif_to_png_engine.py
+
+AVIF → PNG 変換の本体です（Tk に依存しないので、GUI の無いサーバでも動きます）。
+- avif_to_png_converter.py（GUI）もこのエンジンを使って変換します。
+- コマンドラインから直接実行できます:
+    python avif_to_png_engine.py --input photos/ --recursive --jobs 8
+- Python からは ConversionEngine(...).run(files) で、完了順に ConvertResult を受け取れます。
+  files はイテレータでもよく、フォルダ走査（scan_avif）の途中から変換を始められます。
+- 出力は既定で入力と同じフォルダの convert/ 以下に <元の名前>.png（--output-dir で変更可）。
+- 全画素が不透明な画像はアルファ無し（RGB）で保存します。
+- PNG の圧縮は --profile fast / balanced / smallest で速度とサイズのどちらを優先するか選べます。
+"""
+
+import sys
+try:
+    sys.stdout.reconfigure(encoding="utf-8")
+except Exception:
+    pass
+
+import argparse
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from PIL import Image
+
+# PNG保存のプロファイル: 速度とサイズのどちらを優先するか
+PROFILES = {
+    "fast": {"compress_level": 1},
+    "balanced": {"compress_level": 6},
+    "smallest": {"optimize": True},
+}
+PROFILE_LABELS = {"fast": "高速", "balanced": "標準", "smallest": "最小サイズ"}
+DEFAULT_PROFILE = "smallest"
+
+AVIF_EXT = ".avif"
+_END = object()  # 入力の終わりの合図
+
+
+@dataclass
+class ConvertResult:
+    """1ファイル分の変換結果。失敗時は dst が None で error にメッセージが入る"""
+    src: Path
+    dst: Path | None
+    error: str | None = None
+    seconds: float = 0.0
+    size: int = 0
+    attempts: int = 1
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def output_path_for(input_path: Path, out_dir: Path | None = None) -> Path:
+    """出力先。既定は入力と同じフォルダの convert/ 以下"""
+    return (out_dir or input_path.parent / "convert") / input_path.with_suffix(".png").name
+
+
+def convert_file(input_path, profile: str = DEFAULT_PROFILE, out_dir: Path | None = None) -> ConvertResult:
+    """AVIFファイルを1つPNGに変換。失敗時は例外送出"""
+    start = time.perf_counter()
+    input_path = Path(input_path)
+    output_path = output_path_for(input_path, out_dir)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with Image.open(input_path) as img:
+        if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+            # 透過対応。ただし全画素が不透明ならアルファを付けない（サイズと保存時間の無駄）
+            img = img.convert("RGBA")
+            if img.getchannel("A").getextrema() == (255, 255):
+                img = img.convert("RGB")
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        img.save(output_path, "PNG", **PROFILES[profile])
+
+    return ConvertResult(input_path, output_path, None, time.perf_counter() - start, output_path.stat().st_size)
+
+
+def scan_avif(root, recursive: bool = True) -> Iterator[Path]:
+    """os.scandir でフォルダをたどり、見つけた順に AVIF ファイルを返す（全件の列挙を待たない）"""
+    stack = [os.fspath(root)]
+    while stack:
+        subdirs = []
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                subdirs.append(entry.path)
+                        elif entry.name.lower().endswith(AVIF_EXT) and entry.is_file():
+                            yield Path(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            # アクセス権の無いフォルダなどは飛ばす
+            continue
+        stack.extend(sorted(subdirs, reverse=True))
+
+
+def iter_avif_files(paths: Iterable, recursive: bool = False) -> Iterator[Path]:
+    """パス（ファイル/フォルダ）から AVIF ファイルを列挙。フォルダは recursive=True で配下もたどる"""
+    for p in map(Path, paths):
+        if p.is_dir():
+            yield from scan_avif(p, recursive)
+        elif p.suffix.lower() == AVIF_EXT:
+            yield p
+
+
+class ConversionEngine:
+    """AVIF → PNG の並列変換エンジン。
+
+    AVIFのデコードもPNGのエンコードもGILを解放するので、スレッドでCPUコア数ぶん並列に変換する。
+    入力はイテレータのまま別スレッドで必要な分だけ取り出し、結果は完了順に返す
+    （入力側がフォルダ走査などで待たされても、変換済みの結果は待たずに返る）。
+    cancel() は別スレッドから呼んでよく、待ち行列のファイルは即座に取り消す（変換中のファイルは裏で完了させる）。
+    """
+
+    def __init__(self, workers: int | None = None, profile: str = DEFAULT_PROFILE,
+                 out_dir: Path | None = None, retries: int = 1):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.profile = profile
+        self.out_dir = out_dir
+        self.retries = retries
+        self._cancel = threading.Event()
+        self._executor = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, files: Iterable) -> Iterator[ConvertResult]:
+        """files を変換し、完了順に ConvertResult を返す。失敗したファイルは retries 回まで再トライする"""
+        self._cancel.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        limit = self.workers * 2
+        inbox = queue.Queue(maxsize=limit)
+        stop = threading.Event()
+        threading.Thread(target=self._feed, args=(files, inbox, stop), daemon=True).start()
+        pending = {}
+        exhausted = False
+
+        def submit(src, attempt) -> bool:
+            # cancel() は別スレッドから executor を止めるので、止められた後の submit は通常の終了として扱う
+            if self.cancelled:
+                return False
+            try:
+                fut = self._executor.submit(convert_file, src, self.profile, self.out_dir)
+            except RuntimeError:
+                if self.cancelled:
+                    return False
+                raise
+            pending[fut] = (Path(src), attempt)
+            return True
+
+        try:
+            while not self.cancelled:
+                # 同時に抱えるファイル数を抑えつつ、空いた分だけ入力を取り出す
+                # （変換中のファイルが無いときだけ、次の入力が届くのを少し待つ）
+                while not exhausted and len(pending) < limit:
+                    try:
+                        src = inbox.get(block=not pending, timeout=0.1)
+                    except queue.Empty:
+                        break
+                    if src is _END:
+                        exhausted = True
+                        break
+                    if not submit(src, 1):
+                        break
+                if not pending:
+                    if exhausted:
+                        break
+                    continue
+                # キャンセルに気付けるよう、短い間隔で待つ
+                done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    src, attempt = pending.pop(fut)
+                    if fut.cancelled() or self.cancelled:
+                        continue
+                    try:
+                        result = fut.result()
+                    except Exception as e:
+                        if attempt <= self.retries and submit(src, attempt + 1):
+                            continue
+                        if self.cancelled:
+                            continue
+                        result = ConvertResult(src, None, str(e))
+                    result.attempts = attempt
+                    yield result
+        finally:
+            stop.set()  # 入力スレッドを止める
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _feed(self, files: Iterable, inbox: queue.Queue, stop: threading.Event) -> None:
+        """入力スレッド。files を取り出して inbox に渡し、最後に _END を置く"""
+        def put(item) -> bool:
+            while not (stop.is_set() or self.cancelled):
+                try:
+                    inbox.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            for src in files:
+                if not put(src):
+                    return
+        finally:
+            put(_END)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="AVIF → PNG 一括変換（GUI なし）")
+    parser.add_argument("--input", nargs="+", required=True, help="入力 AVIF ファイル or フォルダ（複数可）")
+    parser.add_argument("-r", "--recursive", action="store_true", help="フォルダ配下を再帰的にたどる")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="並列数（既定: 0 = 論理CPU数）")
+    parser.add_argument("--profile", choices=list(PROFILES), default=DEFAULT_PROFILE,
+                        help=f"PNG圧縮のプロファイル（既定: {DEFAULT_PROFILE}）")
+    parser.add_argument("-o", "--output-dir", default=None,
+                        help="出力先フォルダ（既定: 入力と同じフォルダの convert/）")
+    parser.add_argument("--retries", type=int, default=1, help="失敗時の再トライ回数（既定: 1）")
+    args = parser.parse_args()
+
+    engine = ConversionEngine(args.jobs, args.profile,
+                              Path(args.output_dir) if args.output_dir else None, args.retries)
+    print(f"[INFO] jobs={engine.workers} / profile={args.profile}")
+
+    start = time.perf_counter()
+    ok = failed = total_bytes = 0
+    try:
+        # フォルダの走査と並行して、見つかったファイルから変換していく
+        for r in engine.run(iter_avif_files(args.input, args.recursive)):
+            if r.ok:
+                ok += 1
+                total_bytes += r.size
+                print(f"[OK] {r.src.name} -> {r.dst} ({r.seconds * 1000:.0f} ms, {r.size / 1024:,.0f} KB)")
+            else:
+                failed += 1
+                print(f"[ERR] {r.src.name}: {r.error}")
+    except KeyboardInterrupt:
+        engine.cancel()
+        print("\n[INFO] キャンセルしました")
+
+    if not ok + failed and not engine.cancelled:
+        print("[WARN] AVIFファイルが見つかりませんでした", file=sys.stderr)
+        return 1
+
+    elapsed = time.perf_counter() - start
+    print(f"\n[完了] {ok}/{ok + failed} 件 変換（失敗 {failed} 件, {elapsed:.1f}s, "
+          f"{ok / elapsed if elapsed else 0:.1f} files/s, 出力 {total_bytes / 1024 / 1024:,.1f} MB）")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
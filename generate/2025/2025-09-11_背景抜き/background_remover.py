@@ -6,30 +6,37 @@ rembgライブラリを使用して画像の背景を透明にします
 
 使用方法:
 python background_remover.py input_image.jpg [output_image.png]
+python background_remover.py input_image.jpg --server   # 常駐サーバ(_KAMUI/helper/rembg_server.py)を利用
 
 依存関係:
 pip install rembg[new] pillow
+
+スクリプトから呼ぶ場合は _KAMUI/helper/bg_removal.py の remove_many() を直接使うと、
+複数枚をモデル1回のロードで処理できます。
 """
 
 import sys
-import os
 from pathlib import Path
-from rembg import remove
-from PIL import Image
 import argparse
 
+# 処理本体と常駐サーバのクライアントは _KAMUI/helper のものを共有する
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "_KAMUI" / "helper"))
+from bg_removal import Options, remove_one
+from rembg_server import is_alive, server_url
+
 
-def remove_background(input_path, output_path=None, model_name='u2net'):
+def remove_background(input_path, output_path=None, model_name='u2net', server=None):
     """
-    画像の背景を透過させる
+    画像の背景を透過させる（処理本体は _KAMUI/helper/bg_removal.py）
     
     Args:
         input_path (str): 入力画像のパス
         output_path (str, optional): 出力画像のパス
         model_name (str): 使用するモデル名 (u2net, u2netp, silueta, isnet-general-use)
+        server (str, optional): 常駐サーバのURL。指定時はモデルをロードせずサーバに依頼
     
     Returns:
-        str: 出力ファイルのパス
+        str: 出力ファイルのパス（失敗時は None）
     """
     input_path = Path(input_path)
     
@@ -46,39 +53,17 @@ def remove_background(input_path, output_path=None, model_name='u2net'):
     print(f"出力ファイル: {output_path}")
     print(f"使用モデル: {model_name}")
     
-    try:
-        # 画像を読み込み
-        with open(input_path, 'rb') as input_file:
-            input_data = input_file.read()
-        
-        # 背景除去処理
-        print("背景除去処理中...")
-        output_data = remove(input_data, model_name=model_name)
-        
-        # 結果を保存
-        with open(output_path, 'wb') as output_file:
-            output_file.write(output_data)
-        
-        # ファイルサイズ確認
-        if output_path.exists() and output_path.stat().st_size > 0:
-            # 画像として読み込み可能か確認
-            try:
-                with Image.open(output_path) as img:
-                    print(f"✓ 背景透過完了: {output_path}")
-                    print(f"  - サイズ: {img.size}")
-                    print(f"  - モード: {img.mode}")
-                    print(f"  - ファイルサイズ: {output_path.stat().st_size:,} bytes")
-                return str(output_path)
-            except Exception as e:
-                print(f"✗ 出力ファイルが破損しています: {e}")
-                return None
-        else:
-            print("✗ 出力ファイルが正常に作成されませんでした")
-            return None
-            
-    except Exception as e:
-        print(f"✗ エラーが発生しました: {e}")
+    # 背景除去処理（モデルセッションはプロセス内で使い回される）
+    print("背景除去処理中...")
+    result = remove_one(input_path, output_path, Options(model=model_name, force=True), server=server)
+    if not result.ok:
+        print(f"✗ エラーが発生しました: {result.error}")
         return None
+    
+    print(f"✓ 背景透過完了: {result.dst}")
+    print(f"  - サイズ: {result.size}")
+    print(f"  - ファイルサイズ: {result.out_bytes:,} bytes")
+    return str(result.dst)
 
 
 def main():
@@ -88,6 +73,8 @@ def main():
     parser.add_argument('--model', default='u2net', 
                        choices=['u2net', 'u2netp', 'silueta', 'isnet-general-use'],
                        help='使用するモデル (デフォルト: u2net)')
+    parser.add_argument('--server', nargs='?', const='', default=None,
+                       help='常駐サーバに処理を依頼 (URL省略時は REMBG_SERVER か http://127.0.0.1:7010)')
     
     if len(sys.argv) == 1:
         parser.print_help()
@@ -95,12 +82,20 @@ def main():
         print("  python background_remover.py image.jpg")
         print("  python background_remover.py image.jpg output.png")
         print("  python background_remover.py image.jpg --model u2netp")
+        print("  python background_remover.py image.jpg --server")
         return
     
     args = parser.parse_args()
     
+    server = None
+    if args.server is not None:
+        server = server_url(args.server)
+        if not is_alive(server):
+            print(f"⚠ サーバに接続できません: {server}（このプロセス内で処理します）")
+            server = None
+
     # 背景除去実行
-    result = remove_background(args.input, args.output, args.model)
+    result = remove_background(args.input, args.output, args.model, server)
     
     if result:
         print(f"\n✅ 処理完了: {result}")